@@ -0,0 +1,216 @@
+"""
+Micro-benchmarks of core request path: registry, input handler, config, request cache,
+pipeline engines and delivery. Runs offline against temporary data directory
+and writes machine-readable results, previous results can be compared with current ones.
+Run from app directory: python -m benchmarks.core_paths --output core_paths.json
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import types
+
+WORKDIR = os.getcwd()  # core changes working directory on import
+TEMPORARY_DATA = "WEARNOTIFY_DATA_PATH" not in os.environ
+if TEMPORARY_DATA:
+    os.environ["WEARNOTIFY_DATA_PATH"] = tempfile.mkdtemp(prefix="wearnotify-bench-")
+
+from core import cache, delivery, input_manager, registry  # noqa: E402, data path must be set first
+from core.appconfig import DATA_PATH  # noqa: E402
+from core.appinfo import APP_VERSION  # noqa: E402
+from core.config import Config  # noqa: E402
+from core.context import InputContext  # noqa: E402
+from core.models import Module, DeliveryService  # noqa: E402
+from core.pipeline import Pipeline  # noqa: E402
+
+TEXT = ("Notification from wearable: battery is low, next meeting starts in ten minutes. "
+        "Уведомление: заряд низкий, встреча через десять минут. ") * 32
+
+
+class BenchmarkApp:
+    """
+    Minimal app with one echo module, without plugins and input services
+    """
+
+    def __init__(self):
+        self.modules = {}
+        self.extensions = {}
+        self.input_services = {}
+        self.runtime_cache = cache.RuntimeCache(self)
+        self.mnems = {}
+        self._current_user_action = None
+        self.config = Config()
+        self.registries = registry.get_registry()
+        native = types.ModuleType("benchmark")
+        native.swallow = lambda value: value
+        self.modules["benchmark"] = Module("benchmark", native, None, self)
+        self.registries["benchmark"] = "benchmark"
+        self.registries["default"] = "benchmark"
+        self.config.load(self)
+
+
+def memory_service(app, packets):
+    native = types.ModuleType("memory")
+    native.send = packets.append
+    return DeliveryService("memory", native, None, app)
+
+
+def packetizer(app, engine, limit_type):
+    def setup():
+        app.config.put("PIPELINE_ENGINE", engine)
+
+    def run():
+        pipeline = Pipeline(app.config)
+        pipeline.config(limit_type=limit_type, initial_delay=0, packet_delay=0, packets_count=1 << 30)
+        pipeline.put(TEXT)
+        return list(pipeline)
+
+    return setup, run
+
+
+def collect(app):
+    """
+    :return: dict name -> (setup function or None, benchmarked function)
+    """
+    registries = app.registries
+    modules = app.modules
+    context = InputContext()
+    packets = []
+    services = [memory_service(app, packets)]
+    cache.put_request_cache("benchmark hit", TEXT)
+
+    def roll():
+        packets.clear()
+        pipeline = Pipeline(app.config)
+        pipeline.config(initial_delay=0, packet_delay=0, packets_count=1 << 30)
+        pipeline.put(TEXT)
+        delivery.roll_pipeline(pipeline, services)
+
+    counter = iter(range(sys.maxsize))
+    return {
+        "registry.split": (None, lambda: registry.split("benchmark weather today", registries)),
+        "registry.split_default": (None, lambda: registry.split("weather today", registries)),
+        "registry.route": (None, lambda: registry.route("benchmark", modules, registries, app)),
+        "registry.route_default": (None, lambda: registry.route("default", modules, registries, app)),
+        "input_manager.input_handler": (None, lambda: input_manager.input_handler(
+            "benchmark weather today", registries, context, modules, app.config, app)),
+        "config.absolute_cfg": (None, lambda: app.config.absolute_cfg("default_encoding")),
+        "config.absolute_cfg_nested": (None, lambda: app.config.absolute_cfg("pipeline.packet_delay")),
+        "cache.hit": (None, lambda: cache.lookup_request("benchmark hit")),
+        "cache.miss": (None, lambda: cache.lookup_request("benchmark miss")),
+        "cache.put": (None, lambda: cache.put_request_cache(f"benchmark put {next(counter) % 256}", TEXT)),
+        "pipeline.symbol": packetizer(app, "DANDELION", "symbol"),
+        "pipeline.bytes": packetizer(app, "DANDELION", "bytes"),
+        "pipeline.words": packetizer(app, "DANDELION", "words"),
+        "pipeline.rose": packetizer(app, "ROSE", "symbol"),
+        "pipeline.stream": packetizer(app, "STREAM", "symbol"),
+        "delivery.roll_pipeline": (lambda: app.config.put("PIPELINE_ENGINE", "DANDELION"), roll),
+    }
+
+
+def measure(function, repeat, min_time):
+    """
+    Calibrates count of calls so one repeat lasts at least min_time
+    :return: dict with per-call timings in microseconds
+    """
+    number = 1
+    while True:
+        begin = time.perf_counter()
+        for _ in range(number):
+            function()
+        elapsed = time.perf_counter() - begin
+        if elapsed >= min_time:
+            break
+        number *= 2 if elapsed <= 0 else max(2, min(10, int(min_time / elapsed) + 1))
+    timings = [elapsed / number]
+    for _ in range(repeat - 1):
+        begin = time.perf_counter()
+        for _ in range(number):
+            function()
+        timings.append((time.perf_counter() - begin) / number)
+    best = min(timings)
+    return {
+        "calls": number,
+        "best_us": round(best * 1e6, 3),
+        "median_us": round(statistics.median(timings) * 1e6, 3),
+        "ops_per_s": round(1 / best, 1) if best else None
+    }
+
+
+def compare(results, baseline, threshold):
+    """
+    Prints ratio against baseline results
+    :return: names of benchmarks which are slower than threshold
+    """
+    regressions = []
+    print(f"{'benchmark':<32}{'baseline, us':>14}{'current, us':>14}{'ratio':>8}", file=sys.stderr)
+    for name, result in results.items():
+        previous = baseline.get(name)
+        if not previous or not previous["best_us"]:
+            continue
+        ratio = result["best_us"] / previous["best_us"]
+        mark = ""
+        if ratio > 1 + threshold:
+            regressions.append(name)
+            mark = "  REGRESSION"
+        print(f"{name:<32}{previous['best_us']:>14.3f}{result['best_us']:>14.3f}{ratio:>8.2f}{mark}",
+              file=sys.stderr)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Core request path micro-benchmarks")
+    parser.add_argument("--output", help="file for JSON results, stdout if not specified")
+    parser.add_argument("--compare", help="JSON results of previous run")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown against baseline")
+    parser.add_argument("--filter", default="", help="run benchmarks with names containing this string")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--min-time", type=float, default=0.05, help="seconds per repeat")
+    args = parser.parse_args()
+
+    try:
+        app = BenchmarkApp()
+        results = {}
+        for name, (setup, function) in collect(app).items():
+            if args.filter not in name:
+                continue
+            if setup:
+                setup()
+            results[name] = measure(function, args.repeat, args.min_time)
+            print(f"{name:<32}{results[name]['best_us']:>14.3f} us", file=sys.stderr)
+    finally:
+        cache.REQUEST_STORE.close()
+        if TEMPORARY_DATA:
+            shutil.rmtree(DATA_PATH, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "app_version": ".".join(map(str, APP_VERSION)),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "repeat": args.repeat,
+            "min_time": args.min_time
+        },
+        "results": results
+    }
+    if args.output:
+        with open(os.path.join(WORKDIR, args.output), "w") as fobj:
+            json.dump(report, fobj, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    if args.compare:
+        with open(os.path.join(WORKDIR, args.compare)) as fobj:
+            regressions = compare(results, json.load(fobj)["results"], args.threshold)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+"""
+Load benchmark of mnemonic server and App.process.
+App is started with temporary data directory, stub delivery service and zero pipeline delays,
+then HTTP endpoint of mnemonic server is driven by concurrent keep-alive clients.
+Run from app directory: python -m benchmarks.mnemonic_load --mix text --concurrency 8
+"""
+import argparse
+import http.client
+import itertools
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+import types
+from threading import Thread, Lock, local
+
+TEMPORARY_DATA = "WEARNOTIFY_DATA_PATH" not in os.environ
+if TEMPORARY_DATA:
+    os.environ["WEARNOTIFY_DATA_PATH"] = tempfile.mkdtemp(prefix="wearnotify-bench-")
+
+import common  # noqa: E402, data path must be set before core is imported
+from core.appconfig import DATA_PATH  # noqa: E402
+from core.models import Module, DeliveryService  # noqa: E402
+
+PHASES = ("input", "cache", "module", "delivery")
+WORDS = ["weather", "battery", "calendar", "message", "reminder", "alarm", "news", "note"]
+MANIPULATOR_TAPS = "1156798"  # input, push, repeat, erase, modcursor and state taps
+
+
+class PhaseRecorder:
+    """
+    Accumulates time of request phases of current thread
+    """
+
+    def __init__(self):
+        self._local = local()
+        self._lock = Lock()
+        self.samples = {name: [] for name in PHASES + ("handle",)}
+
+    def start(self):
+        self._local.phases = dict.fromkeys(PHASES, 0.0)
+
+    def wrap(self, phase, function):
+        def wrapper(*args, **kwargs):
+            begin = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.add(phase, time.perf_counter() - begin)
+        return wrapper
+
+    def wrap_async(self, phase, function):
+        async def wrapper(*args, **kwargs):
+            begin = time.perf_counter()
+            try:
+                return await function(*args, **kwargs)
+            finally:
+                self.add(phase, time.perf_counter() - begin)
+        return wrapper
+
+    def add(self, phase, seconds):
+        phases = getattr(self._local, "phases", None)
+        if phases is not None:
+            phases[phase] += seconds
+
+    def finish(self, total):
+        with self._lock:
+            for phase, seconds in self._local.phases.items():
+                self.samples[phase].append(seconds)
+            self.samples["handle"].append(total)
+
+    @property
+    def handled(self):
+        return len(self.samples["handle"])
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def benchmark_module(app, size):
+    native = types.ModuleType("benchmark")
+    native.SETTINGS = {"NOCACHE": False}
+    native.swallow = lambda value: (value.strip() + " ") * size
+    return Module("benchmark", native, None, app)
+
+
+def stub_service(app, counter):
+    native = types.ModuleType("benchmark")
+    native.send = lambda packet: next(counter)
+    return DeliveryService("benchmark", native, None, app)
+
+
+def prepare_app(args, recorder, sent):
+    app = common.App()
+    app.delivery_services = [stub_service(app, sent)]
+    app.modules["benchmark"] = benchmark_module(app, args.response_size)
+    app.registries["benchmark"] = "benchmark"
+    app.registries["default"] = "benchmark"
+    app.pipeline.config(initial_delay=0, packet_delay=0, special_delay=0, packets_count=1 << 30)
+
+    app.handle_input = recorder.wrap("input", app.handle_input)
+    app.mapmnem = recorder.wrap("input", app.mapmnem)
+    app.post = recorder.wrap("delivery", app.post)
+    app.post_async = recorder.wrap_async("delivery", app.post_async)
+    direct_message = app._direct_message
+    # manipulator messages sleep after sending, delays are excluded as in pipeline
+    app._direct_message = recorder.wrap("delivery", lambda text, timeout: direct_message(text, 0))
+    common.lookup_request = recorder.wrap("cache", common.lookup_request)
+    common.put_request_cache = recorder.wrap("cache", common.put_request_cache)
+    module = app.modules["benchmark"]
+    module.swallow = recorder.wrap("module", module.swallow)
+    module.swallow_async = recorder.wrap_async("module", module.swallow_async)
+
+    server = app.input_services["mnemonic_server"].native_module
+    handler = server.handler
+
+    def timed_handler(request):
+        recorder.start()
+        begin = time.perf_counter()
+        try:
+            return handler(request)
+        finally:
+            recorder.finish(time.perf_counter() - begin)
+
+    server.handler = timed_handler
+    app.config.put("mnemonic_server.mode", 0x1 if args.mix == "manip" else 0x0)
+    app.config.put("mnemonic_server.server", args.server)
+    app.config.put("mnemonic_server.workers", args.workers)
+    app.config.put("mnemonic_server.queue_size", args.queue_size)
+    app.config.put("mnemonic_server.coalesce_window", args.coalesce_window)
+    server.exit()
+    server.init()
+    time.sleep(0.2)
+    return app, server
+
+
+def requests(mix, count, seed):
+    rnd = random.Random(seed)
+    for _ in range(count):
+        if mix == "text":
+            yield "POST", "/", "request=" + "benchmark " + rnd.choice(WORDS)
+        elif mix == "manip":
+            yield "GET", "/" + rnd.choice(MANIPULATOR_TAPS), None
+        else:
+            yield "GET", "/" + str(rnd.randint(0, 9)), None
+
+
+def client(port, jobs, lock, results):
+    connection = http.client.HTTPConnection("localhost", port)
+    while True:
+        with lock:
+            job = next(jobs, None)
+        if job is None:
+            break
+        method, path, body = job
+        headers = {"Content-Type": "application/x-www-form-urlencoded"} if body else {}
+        begin = time.perf_counter()
+        connection.request(method, path, body=body, headers=headers)
+        response = connection.getresponse()
+        data = response.read()
+        elapsed = time.perf_counter() - begin
+        coalesced = False
+        if response.getheader("Content-Type") == "application/json":
+            coalesced = json.loads(data).get("coalesced", False)
+        with lock:
+            results.append((response.status, elapsed, coalesced))
+    connection.close()
+
+
+def report(name, values):
+    values = [value * 1000 for value in values]
+    return (f"{name:<10}{percentile(values, 50):>10.2f}{percentile(values, 95):>10.2f}"
+            f"{percentile(values, 99):>10.2f}{max(values, default=0.0):>10.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mnemonic server load benchmark")
+    parser.add_argument("--mix", choices=["manip", "mnemonic", "text"], default="text",
+                        help="digits in manipulator mode, digits in mnemonic mode or free-text requests")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--server", choices=["threaded", "asyncio"], default="threaded")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--queue-size", type=int, default=1024)
+    parser.add_argument("--coalesce-window", type=float, default=0.3, help="asyncio server only, in seconds")
+    parser.add_argument("--response-size", type=int, default=16, help="module response repeats")
+    parser.add_argument("--timeout", type=float, default=60, help="seconds to wait for handling")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    recorder = PhaseRecorder()
+    sent = itertools.count()
+    app, server = prepare_app(args, recorder, sent)
+    try:
+        jobs = requests(args.mix, args.requests, args.seed)
+        lock = Lock()
+        results = []
+        begin = time.perf_counter()
+        clients = [Thread(target=client, args=(server.PORT, jobs, lock, results))
+                   for _ in range(args.concurrency)]
+        for thread in clients:
+            thread.start()
+        for thread in clients:
+            thread.join()
+        accepted = sum(1 for status, _, coalesced in results if status == 200 and not coalesced)
+        deadline = time.perf_counter() + args.timeout
+        while recorder.handled < accepted and time.perf_counter() < deadline:
+            time.sleep(0.01)
+        elapsed = time.perf_counter() - begin
+    finally:
+        app.quit()
+        if TEMPORARY_DATA:
+            shutil.rmtree(DATA_PATH, ignore_errors=True)
+
+    rejected = sum(1 for status, *_ in results if status != 200)
+    coalesced = sum(1 for *_, flag in results if flag)
+    print(f"mix={args.mix} server={args.server} concurrency={args.concurrency} workers={args.workers}")
+    print(f"requests: {len(results)}, handled: {recorder.handled}, rejected: {rejected}, "
+          f"coalesced: {coalesced}, packets delivered: {next(sent)}")
+    print(f"throughput: {recorder.handled / elapsed:.1f} req/s in {elapsed:.2f}s")
+    print(f"{'phase, ms':<10}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}")
+    print(report("http", [latency for _, latency, _ in results]))
+    for phase in PHASES + ("handle",):
+        print(report(phase, recorder.samples[phase]))
+
+
+if __name__ == "__main__":
+    main()
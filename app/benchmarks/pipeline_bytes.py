@@ -0,0 +1,102 @@
+"""
+Benchmark of bytes pregenerator engine against previous per-character implementation.
+Run from app directory: python -m benchmarks.pipeline_bytes
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+TEMPORARY_DATA = "WEARNOTIFY_DATA_PATH" not in os.environ
+if TEMPORARY_DATA:
+    os.environ["WEARNOTIFY_DATA_PATH"] = tempfile.mkdtemp(prefix="wearnotify-bench-")
+
+from core.appconfig import DATA_PATH  # noqa: E402, data path must be set first
+from core.config import Config  # noqa: E402
+from core.pipeline import Pipeline  # noqa: E402
+
+
+class BenchmarkApp:
+    modules = {}
+    extensions = {}
+    input_services = {}
+
+
+SAMPLES = {
+    "ascii": "The quick brown fox jumps over the lazy dog. ",
+    "cyrillic": "Съешь же ещё этих мягких французских булок, да выпей чаю. ",
+    "mixed": "Notification 🔔 уведомление 通知 ✓ ",
+}
+
+
+def legacy_pregenerate_bytes(pipeline, source, encoding="utf-8"):
+    # implementation before linear engine, kept for comparison
+    config = pipeline.configuration
+    ptr = 0
+    i = 1
+    while ptr < len(source):
+        firstbuf = bytes()
+        partnumber = f"{str(i)}." if config["allow_part_number"] else ""
+        firstbuf += partnumber.encode("utf-8")
+        while len(firstbuf) < config["max_packet_length"] and ptr < len(source):
+            byte = source[ptr].encode(encoding)
+            if len(byte) + len(firstbuf) <= config["max_packet_length"]:
+                firstbuf += byte
+                ptr += 1
+            else:
+                break
+        if len(firstbuf) > 0:
+            i += 1
+            yield firstbuf.decode("utf-8")
+
+
+def measure(function, repeat):
+    best = None
+    result = None
+    for _ in range(repeat):
+        begin = time.perf_counter()
+        result = list(function())
+        elapsed = time.perf_counter() - begin
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bytes pregenerator benchmark")
+    parser.add_argument("--size", type=int, default=1048576, help="source length in characters")
+    parser.add_argument("--packet", type=int, default=126, help="max_packet_length in bytes")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--part-number", action="store_true", help="enable allow_part_number")
+    args = parser.parse_args()
+
+    try:
+        # legacy engine never advances if packet can't hold part number and the widest character
+        prefix = len(f"{args.size}.") if args.part_number else 0
+        if args.packet < prefix + 4:
+            parser.error(f"--packet must be at least {prefix + 4} bytes for these arguments")
+        run(args)
+    finally:
+        if TEMPORARY_DATA:
+            shutil.rmtree(DATA_PATH, ignore_errors=True)
+
+
+def run(args):
+    config = Config()
+    config.load(BenchmarkApp())
+    pipeline = Pipeline(config)
+    pipeline.config(limit_type="bytes", max_packet_length=args.packet,
+                    allow_part_number=args.part_number)
+
+    print(f"{'input':<10}{'packets':>10}{'legacy, s':>12}{'linear, s':>12}{'speedup':>10}")
+    for name, sample in SAMPLES.items():
+        source = (sample * (args.size // len(sample) + 1))[:args.size]
+        legacy, expected = measure(lambda: legacy_pregenerate_bytes(pipeline, source), args.repeat)
+        linear, packets = measure(lambda: pipeline.pregenerate_bytes(source), args.repeat)
+        if packets != expected:
+            raise AssertionError(f"Engines produced different packets for {name} input")
+        print(f"{name:<10}{len(packets):>10}{legacy:>12.4f}{linear:>12.4f}{legacy / linear:>9.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,15 +1,21 @@
 import time
 import os
+import asyncio
+from weakref import WeakKeyDictionary
 
 from core.registry import get_registry, route, load_predefined_registries
 from core.module_loader import load_modules
 from core.extension_loader import load_extensions
 from core import delivery
 from core import input_manager
-from core.pipeline import Pipeline
+from core.pipeline import Pipeline, is_stream
+from core.scheduler import DeliveryScheduler
+from core.manifest import StartupManifest
+from core.profiler import PhaseProfiler
+from core.appconfig import STARTUP_MANIFEST
+from core.watcher import ConfigWatcher
 from core.logger import get_logger
-from core.cache import is_request_cached, get_request_cached, \
-    put_request_cache, cleanup, RuntimeCache
+from core.cache import lookup_request, put_request_cache, cleanup, RuntimeCache
 from core.context import InputContext
 from core.config import Config
 from core.storage import get_ooc_commands
@@ -19,25 +25,48 @@ from threading import RLock
 
 
 class App:
-    def __init__(self):
+    def __init__(self, profiler=None):
+        """
+        :param profiler: PhaseProfiler which records startup phases
+        """
         self.logger = get_logger("app")
+        self.profiler = profiler or PhaseProfiler()
+        phase = self.profiler.phase
+        with phase("manifest"):
+            self.manifest = StartupManifest.open() if STARTUP_MANIFEST else StartupManifest(enabled=False)
         self.runtime_cache = RuntimeCache(self)
-        self.mnems = load_global_mnemonics()
+        with phase("mnemonics"):
+            self.mnems = load_global_mnemonics()
         self.config = Config()
         self.logger.debug("Initializing app")
-        self.registries = get_registry()
+        with phase("registries"):
+            self.registries = get_registry()
         self._gsuggestions = tuple(self.registries.keys())
         self._vsuggestions = []
-        self.extensions = load_extensions(self)
-        self.modules = load_modules(self)
-        self.input_services = input_manager.load_services(self)
-        self.config.load(self)
-        load_predefined_registries(self)
+        with phase("requirements"):
+            self.manifest.satisfy(self.manifest.plugin_requirements())
+        with phase("extensions"):
+            self.extensions = load_extensions(self)
+        with phase("modules"):
+            self.modules = load_modules(self)
+        with phase("input services"):
+            self.input_services = input_manager.load_services(self)
+        with phase("config"):
+            self.config.load(self)
+        with phase("predefined registries"):
+            load_predefined_registries(self)
+        if self.config.absolute_cfg("lazy_plugins") and self.config.absolute_cfg("lazy_warmup"):
+            self.modules.warmup(self.config.absolute_cfg("lazy_warmup"))
         self.DEFAULT_GSUGGESTIONS = self._gsuggestions
         self.pipeline = Pipeline(self.config)
-        self.delivery_services = delivery.load_services(self)
+        with phase("delivery services"):
+            self.delivery_services = delivery.load_services(self)
+        with phase("manifest saving"):
+            self.manifest.save()
+        self.scheduler = DeliveryScheduler() if self.config.absolute_cfg("async_delivery") else None
         self.input_context = InputContext()
         self._request_lock = RLock()
+        self._async_locks = WeakKeyDictionary()  # event loop -> asyncio.Lock
         self._mnemmode = self.config.absolute_cfg("default_mnemonic_mode")
         self._mnemmem = self.config.absolute_cfg("default_mnemonic_mode")  # mnemonic mode memory buffer
         self.input_context.sethook(self.context_hook)
@@ -50,6 +79,10 @@ class App:
         self.current_inputservice = self.config.absolute_cfg("default_inputservice")
         for command, value in get_ooc_commands().items():
             self.define_ooc_command(command, value)
+        self.watcher = None
+        if self.config.absolute_cfg("watch_config"):
+            self.watcher = ConfigWatcher(self, self.config.absolute_cfg("watch_interval"))
+            self.watcher.start()
 
     @property
     def request_lock(self):
@@ -151,6 +184,44 @@ class App:
         self.logger.debug("Force clearing all cache...")
         cleanup(True)
 
+    def _prepare_delegate(self, reg, request, user_action, deny_cache):
+        """
+        Routes request and looks it up in cache
+        :return: tuple (module, full request, cached, cached response)
+        """
+        self.logger.debug(f"Delegating request (registry={reg}, request={request})")
+        self._current_user_action = user_action
+        if reg is None or request is None:
+            self.logger.info("Invalid registry")
+            return None, None, False, None
+        module = route(reg, self.modules, self.registries, self)
+        full_request = request
+        if self.input_context.get() is not None:
+            full_request = str(self.input_context.get()) + " " + request
+        if not module:
+            self.logger.debug("Module is None")
+            return None, None, False, None
+        cached, response = (False, None) if deny_cache else lookup_request(full_request)
+        if cached:
+            self.logger.debug(f"Request {request} is cached")
+        else:
+            self.logger.debug(f"Request {request} is not cached")
+        return module, full_request, cached, response
+
+    def _accept_response(self, reg, module, full_request, response):
+        """
+        Caches fresh module response and updates input context
+        """
+        self.logger.info("Got response from module")
+        if not module.configs["NOCACHE"] and response and full_request \
+                and not is_stream(response):
+            put_request_cache(full_request, response, module.configs["CACHE_TTL"])
+        if module != self.input_context.module:
+            self.runtime_cache.remove(module.name)
+        if module.configs.get("ENTER_CONTEXT") and self.input_context.module != module:
+            self.logger.debug("Setting new enter context after response")
+            self.input_context.set(reg, module)
+
     def delegate(self, reg, request, user_action, deny_cache=False, ooc=False):
         """
         Delegates request to specific module
@@ -161,37 +232,34 @@ class App:
         :param ooc: pass out of context command for module
         :return: response object and module
         """
-        self.logger.debug(f"Delegating request (registry={reg}, request={request})")
-        self._current_user_action = user_action
-        if reg is None or request is None:
-            self.logger.info("Invalid registry")
-            return None, None
+        module, full_request, cached, response = self._prepare_delegate(reg, request, user_action,
+                                                                        deny_cache)
+        if module is None or cached:
+            return response, module
+        if ooc:
+            response = module.interrupt_call(request)
         else:
-            module = route(reg, self.modules, self.registries, self)
-            full_request = request
-            if self.input_context.get() is not None:
-                full_request = str(self.input_context.get()) + " " + request
-            if not module:
-                self.logger.debug("Module is None")
-                return None, None
-            if not is_request_cached(full_request) or deny_cache:
-                self.logger.debug(f"Request {request} is not cached")
-                if ooc:
-                    response = module.interrupt_call(request)
-                else:
-                    response = module.swallow(request)
-                self.logger.info("Got response from module")
-                if not module.configs["NOCACHE"] and response and full_request:
-                    put_request_cache(full_request, response)
-                if module != self.input_context.module:
-                    self.runtime_cache.remove(module.name)
-                if module.configs.get("ENTER_CONTEXT") and self.input_context.module != module:
-                    self.logger.debug("Setting new enter context after response")
-                    self.input_context.set(reg, module)
-                return response, module
-            else:
-                self.logger.debug(f"Request {request} is cached")
-                return get_request_cached(full_request), module
+            response = module.swallow(request)
+        self._accept_response(reg, module, full_request, response)
+        return response, module
+
+    async def delegate_async(self, reg, request, user_action, deny_cache=False, ooc=False):
+        """
+        Asynchronous variant of delegate, coroutine module functions are awaited.
+        Request lock is held only while routing and accepting response, not while awaiting module
+        """
+        with self._request_lock:
+            module, full_request, cached, response = self._prepare_delegate(reg, request, user_action,
+                                                                            deny_cache)
+        if module is None or cached:
+            return response, module
+        if ooc:
+            response = await module.interrupt_call_async(request)
+        else:
+            response = await module.swallow_async(request)
+        with self._request_lock:
+            self._accept_response(reg, module, full_request, response)
+        return response, module
 
     def pack(self, request, response, module):
         """
@@ -204,11 +272,17 @@ class App:
 
     def post(self, user_action):
         """
-        Post response on delivery services
+        Post response on delivery services. If delivery scheduler is enabled,
+        pipeline is rolled in background and request lock is released immediately
         :param user_action: action that will be called if message limit is over
         """
-        self.logger.debug("Posting. Rolling pipeline")
-        delivery.roll_pipeline(self.pipeline, self.delivery_services, user_action)
+        if self.scheduler:
+            self.logger.debug("Posting. Scheduling pipeline")
+            pipeline, self.pipeline = self.pipeline, self.pipeline.spawn()
+            self.scheduler.deliver(pipeline, self.delivery_services, user_action)
+        else:
+            self.logger.debug("Posting. Rolling pipeline")
+            delivery.roll_pipeline(self.pipeline, self.delivery_services, user_action)
         self.unlock_requests()
 
     def mapmnem(self, request):
@@ -255,6 +329,12 @@ class App:
         If timeline specified, by finishing signal for delivery services, app will have been slept
         """
         self.logger.info("Sending direct message")
+        if self.scheduler:
+            self.scheduler.submit(self._direct_message, text, timeout)
+        else:
+            self._direct_message(text, timeout)
+
+    def _direct_message(self, text, timeout):
         delivery.begin(self.delivery_services)
         delivery.sendto(text, self.delivery_services)
         time.sleep(timeout)
@@ -267,9 +347,14 @@ class App:
         self.lock_requests()
         self.logger.info("Sending direct message through pipeline")
         self.pipeline.reset()
-        self.pipeline.put(text)
-        delivery.roll_pipeline(self.pipeline, self.delivery_services, user_action)
-        self.pipeline.reset()
+        if self.scheduler:
+            pipeline = self.pipeline.spawn()
+            pipeline.put(text)
+            self.scheduler.deliver(pipeline, self.delivery_services, user_action)
+        else:
+            self.pipeline.put(text)
+            delivery.roll_pipeline(self.pipeline, self.delivery_services, user_action)
+            self.pipeline.reset()
         self.unlock_requests()
 
     def process(self, input_data, user_action,
@@ -301,13 +386,75 @@ class App:
         self.unlock_requests()
         return True
 
+    def _async_lock(self):
+        loop = asyncio.get_running_loop()
+        if loop not in self._async_locks:
+            self._async_locks[loop] = asyncio.Lock()
+        return self._async_locks[loop]
+
+    async def post_async(self, user_action, pipeline=None):
+        """
+        Asynchronous variant of post. Pipeline is rolled without holding request lock,
+        delays don't block event loop
+        :param pipeline: pipeline owned by caller, if None - filled app pipeline is detached
+        """
+        with self._request_lock:
+            if pipeline is None:
+                pipeline, self.pipeline = self.pipeline, self.pipeline.spawn()
+            if self.scheduler:
+                self.logger.debug("Posting. Scheduling pipeline")
+                self.scheduler.deliver(pipeline, self.delivery_services, user_action)
+                return
+        self.logger.debug("Posting. Rolling pipeline asynchronously")
+        await delivery.roll_pipeline_async(pipeline, self.delivery_services, user_action)
+
+    async def process_async(self, input_data, user_action,
+                            mnemonic_handle=False, deny_cache=False, handle_ctx=True,
+                            out_of_context=False):
+        """
+        Asynchronous request -> response -> output device cycle.
+        Requests of one event loop are served in order by asyncio lock, coroutine modules,
+        delivery services and user action are awaited. Request lock guards only
+        synchronous steps, so it's never held across await. Response is put on
+        own pipeline, so sync requests of other threads can't take it over
+        """
+        async with self._async_lock():
+            with self._request_lock:
+                if out_of_context:
+                    self.check_ooc(input_data)
+                if mnemonic_handle:
+                    tmp = self.mapmnem(input_data)
+                    if tmp:
+                        input_data = tmp
+                registry, request, additional = self.handle_input(input_data, handle_ctx)
+                # routed by the same input context which handled input
+                module, full_request, cached, response = self._prepare_delegate(registry, request,
+                                                                                user_action, deny_cache)
+            if module is not None and not cached:
+                response = await module.swallow_async(request)
+                with self._request_lock:
+                    self._accept_response(registry, module, full_request, response)
+            if not response and response != '':
+                return False
+            with self._request_lock:
+                pipeline = self.pipeline.spawn()
+            self.logger.debug(f"Packing response (response={response}, request={request})")
+            delivery.put_on_pipeline(pipeline, request, response, module, self.config)
+            await self.post_async(user_action, pipeline)
+            return True
+
     def quit(self):
         """
         Finalizing App object, calling exit() functions
         """
         self.input_context.null()
+        if self.watcher:
+            self.watcher.stop()
+        if self.scheduler:
+            self.scheduler.shutdown()
         for inputservice in self.input_services:
             self.input_services[inputservice].exit()
+        delivery.shutdown_dispatch()
         for delservice in self.delivery_services:
             delservice.exit()
 
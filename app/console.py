@@ -3,6 +3,7 @@ from time import sleep
 from core.appconfig import WELCOME_MSG, ABOUT_MSG, APP_NAME
 from core.logger import get_logger
 from core.utils import dummy
+from core.profiler import PhaseProfiler
 import sys
 
 logger = get_logger()
@@ -56,7 +57,11 @@ def user_action():
 def main():
     global bundle
     completer = init_completing([])
-    bundle = App()
+    profiler = PhaseProfiler()
+    bundle = App(profiler)
+    if "--profile-startup" in sys.argv:
+        print(profiler.report())
+        print(f"startup manifest: {bundle.manifest.hits} hits, {bundle.manifest.misses} misses")
     bundle.define_ooc_command("termux", termux)
     bundle.define_ooc_command("speak", speak)
     bundle.define_ooc_command("speechon", speech_output)
@@ -23,8 +23,8 @@ PIPELINE = {
     "stop": None,
     "step": -1,
     "max_packet_length": 126,
-    "allow_part_number": False,  # it may cause errors in symbol limit type with very huge packets count
-    "limit_type": "symbol",
+    "allow_part_number": False,
+    "limit_type": "symbol",  # or bytes, words, sentences
     "clear_text": False,  # it's slows app
     "packets_count": 16,
     "packet_delay": 1250,
@@ -35,21 +35,41 @@ PIPELINE = {
 }
 DEFAULT_MODULE_CONFIG = {
     "NOCACHE": False,
+    "CACHE_TTL": None,
     "ENTER_CONTEXT": False,
     "QUIT_COMMANDS": ["quit", "exit", "exit()", "quit()"]
 }
 
 APP_PATH = os.path.abspath("./")
-DATA_PATH = os.path.abspath("../data")
+DATA_PATH = os.path.abspath(os.environ.get("WEARNOTIFY_DATA_PATH", "../data"))
 DEFAULT_ENCODING = "utf-8"
 DEFAULT_MNEMONIC_MODE = 0x1
 ISOLATED_MODULE = False
 MAX_REQUEST_CACHE_SIZE = 262144
+REQUEST_CACHE_BACKEND = "json"  # or "log" - append-only segments, json shards are migrated
+REQUEST_CACHE_LIMITS = {
+    "max_entries": None,
+    "max_bytes": 33554432,
+    "ttl": None,  # seconds, module can override it with CACHE_TTL setting
+    "eviction": "lru"  # or lfu
+}
+REQUEST_CACHE_MEMORY = 4194304  # in-process tier of decoded responses, 0 disables it
 DEFAULT_INPUTSERVICE = "default"
 RESET_PIPECONFIG = False
 AUTO_INITIALIZING_STDMODULES = True # more ram memory will be used
 ONLY_STRING_IO_DATA = False
-PIPELINE_ENGINE = "DANDELION"
+ASYNC_DELIVERY = False  # roll pipeline in background thread without holding request lock
+DELIVERY_MODE = "sequential"  # or parallel - packet is sent to all delivery services concurrently
+DELIVERY_WORKERS = 4
+DELIVERY_TIMEOUT = 5  # seconds, delivery service can override it with DELIVERY_TIMEOUT setting
+DELIVERY_LATENCY_REPORT = False  # log per-service latency report after every rolled pipeline
+PIPELINE_ENGINE = "DANDELION"  # or ROSE, STREAM (lazy packetizing, used for generator sources)
+PIP_WHEELHOUSE = None  # directory with wheels for installing plugin requirements offline
+STARTUP_MANIFEST = True  # cache plugin lookups, requirements and settings in cache/manifest.json
+LAZY_PLUGINS = False  # import modules on first route, modules with literal SETTINGS only
+LAZY_WARMUP = []  # names of lazy modules imported in background after start
+WATCH_CONFIG = False  # reload config.txt, registry.json, commands.json and mnemonic.json on change
+WATCH_INTERVAL = 1.0  # seconds between checks of data files
 LOG_FILE = os.path.join(DATA_PATH, "cache", "logs", format_filename())
 
 LOGGER_CONFIG = {
@@ -1,7 +1,13 @@
 import os
+import time
 import json
-from .appconfig import DATA_PATH, MAX_REQUEST_CACHE_SIZE
+import heapq
+from collections import OrderedDict
+from threading import RLock
+from .appconfig import DATA_PATH, MAX_REQUEST_CACHE_SIZE, REQUEST_CACHE_BACKEND, \
+    REQUEST_CACHE_LIMITS, REQUEST_CACHE_MEMORY
 from .storage import read_json, write_json
+from .logstore import LogRequestStore
 
 from .logger import get_logger
 
@@ -9,6 +15,8 @@ LOGGER = get_logger("cache")
 
 PATH = os.path.join(DATA_PATH, "cache")
 REQUEST_CACHE = os.path.join(PATH, "requests")
+REQUEST_LOG = os.path.join(PATH, "requests_log")
+REQUEST_EXPIRATIONS = os.path.join(PATH, "request_expirations.log")
 
 
 class RuntimeCache:
@@ -71,45 +79,565 @@ class RuntimeCache:
                 return self._storage.pop(name)
 
 
-def put_request_cache(request, data):
+class ShardedRequestStore:
+    """
+    Request cache stored in numbered JSON shards.
+    In-memory index (request -> shard number) is built once and maintained
+    on every put/remove, so lookups never scan shards
+    """
+
+    def __init__(self, path, max_shard_size=MAX_REQUEST_CACHE_SIZE):
+        self._path = path
+        self._max_shard_size = max_shard_size
+        self._index = {}
+        self._last = 0
+        self._lock = RLock()
+        self.reload()
+
+    def _shard_path(self, number):
+        return os.path.join(self._path, str(number))
+
+    def _shards(self):
+        return sorted(int(name) for name in os.listdir(self._path) if name.isdigit())
+
+    def _read_shard(self, number):
+        path = self._shard_path(number)
+        if not os.path.exists(path):
+            return {}
+        return read_json(path)
+
+    def reload(self):
+        """
+        Rebuilds index from shards on disk. Newer shards override older ones
+        """
+        with self._lock:
+            self._index.clear()
+            self._last = 0
+            for number in self._shards():
+                try:
+                    loaded = read_json(self._shard_path(number))
+                except (OSError, ValueError):
+                    LOGGER.warning(f"Skipping broken request cache file: {number}")
+                    continue
+                for request in loaded:
+                    self._index[request] = number
+                self._last = number
+            LOGGER.debug(f"Request cache index built: {len(self._index)} entries")
+
+    def __contains__(self, request):
+        return request in self._index
+
+    def __len__(self):
+        return len(self._index)
+
+    def find(self, request):
+        return self._index.get(request)
+
+    def path(self, request):
+        number = self._index.get(request)
+        if number is not None:
+            return self._shard_path(number)
+
+    def lookup(self, request):
+        """
+        Returns tuple (hit, value). Reads only the shard holding the request
+        """
+        with self._lock:
+            number = self._index.get(request)
+            if number is None:
+                return False, None
+            data = self._read_shard(number)
+            if request not in data:
+                LOGGER.warning(f"Request cache index is stale for {request}")
+                self._index.pop(request)
+                return False, None
+        LOGGER.debug(f"Request {request} has found in cache")
+        return True, data[request]
+
+    def put(self, request, data):
+        with self._lock:
+            file = self._shard_path(self._last)
+            if os.path.exists(file) and os.path.getsize(file) > self._max_shard_size:
+                self._last += 1
+                file = self._shard_path(self._last)
+                LOGGER.debug(f"Filling new request cache file: {self._last}")
+                cache = {}
+            else:
+                cache = self._read_shard(self._last)
+            cache[request] = data
+            LOGGER.debug(f"Putting request cache file: {self._last}")
+            write_json(file, cache)
+            previous = self._index.get(request)
+            self._index[request] = self._last
+            if previous is not None and previous != self._last:
+                self._drop_from_shard(previous, request)
+
+    def _drop_from_shard(self, number, request):
+        data = self._read_shard(number)
+        if data.pop(request, None) is not None:
+            if not data and number != self._last:
+                os.remove(self._shard_path(number))
+            else:
+                write_json(self._shard_path(number), data)
+
+    def describe(self):
+        """
+        Yields (request, size in bytes, creation time) for every indexed request
+        """
+        with self._lock:
+            for number in self._shards():
+                created = os.path.getmtime(self._shard_path(number))
+                for request, data in self._read_shard(number).items():
+                    if self._index.get(request) == number:
+                        yield request, _entry_size(request, data), created
+
+    def remove(self, request):
+        with self._lock:
+            number = self._index.pop(request, None)
+            if number is None:
+                return False
+            self._drop_from_shard(number, request)
+        LOGGER.debug(f"Removing {request}")
+        return True
+
+    def close(self):
+        pass
+
+    def clear(self):
+        with self._lock:
+            for number in self._shards():
+                os.remove(self._shard_path(number))
+            self._index.clear()
+            self._last = 0
+
+
+class MemoryTier:
+    """
+    In-process LRU of decoded responses bounded by total size in bytes
+    """
+
+    def __init__(self, max_bytes):
+        self._max_bytes = max_bytes
+        self._values = OrderedDict()  # request -> (size, value)
+        self._bytes = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._values)
+
+    @property
+    def size(self):
+        return self._bytes
+
+    def get(self, request):
+        item = self._values.get(request)
+        if item is None:
+            return False, None
+        self._values.move_to_end(request)
+        return True, item[1]
+
+    def put(self, request, value, size):
+        self.remove(request)
+        if not self._max_bytes or size > self._max_bytes:
+            return
+        self._values[request] = (size, value)
+        self._bytes += size
+        while self._bytes > self._max_bytes:
+            _, (evicted, _) = self._values.popitem(last=False)
+            self._bytes -= evicted
+            self.evictions += 1
+
+    def remove(self, request):
+        item = self._values.pop(request, None)
+        if item:
+            self._bytes -= item[0]
+
+    def clear(self):
+        self._values.clear()
+        self._bytes = 0
+
+
+class BoundedRequestStore:
+    """
+    Capacity-bounded view over request store.
+    Tracks size, expiration time and usage of every entry and evicts
+    by LRU or LFU policy when max entries/bytes limits are exceeded.
+    Hot entries are served from memory tier without touching disk
+    """
+
+    def __init__(self, store, max_entries=None, max_bytes=None, ttl=None, eviction="lru",
+                 memory_bytes=0, expirations=None):
+        """
+        :param expirations: journal file keeping expiration times of entries
+        """
+        self._store = store
+        self._journal_path = expirations
+        self._journal = None
+        self._journal_records = 0
+        self._expirations = {}  # request -> expiration time written to journal
+        self._deadlines = []  # heap of (expiration time, request), may keep outdated items
+        self._memory = MemoryTier(memory_bytes)
+        self._stats = dict.fromkeys(["memory_hits", "disk_hits", "misses", "evictions"], 0)
+        self._max_entries = max_entries
+        self._max_bytes = max_bytes
+        self._ttl = ttl
+        if eviction not in ("lru", "lfu"):
+            LOGGER.error(f"Unknown request cache eviction policy {eviction}, using lru")
+            eviction = "lru"
+        self._eviction = eviction
+        self._entries = OrderedDict()  # request -> [size, expiration time, hits]
+        self._frequencies = {}  # hits -> requests with such hits in LRU order
+        self._lowest = 0
+        self._bytes = 0
+        self._lock = RLock()
+        self._track_stored()
+
+    def _track_stored(self):
+        """
+        Rebuilds entries from store. Expiration times are taken from journal, entries
+        which aren't in journal expire in ttl from now and are written to it,
+        so restarts never extend their life again
+        """
+        self._entries.clear()
+        self._frequencies.clear()
+        self._deadlines.clear()
+        self._bytes = 0
+        journal = self._read_journal()
+        self._expirations = {}
+        now = time.time()
+        described = sorted(self._store.describe(), key=lambda item: item[2])
+        for request, size, _ in described:
+            if request in journal:
+                expires = self._expirations[request] = journal[request]
+            elif self._ttl:
+                expires = self._expirations[request] = now + self._ttl
+            else:
+                expires = None
+            self._entries[request] = [size, expires, 0]
+            self._count(request, 0)
+            self._bytes += size
+            if expires is not None:
+                self._deadlines.append((expires, request))
+        heapq.heapify(self._deadlines)
+        self._sweep()
+        self._evict()
+        self._rewrite_journal()
+
+    def _read_journal(self):
+        """
+        :return: dict request -> expiration time from journal lines [request, time] or [request]
+        """
+        result = {}
+        if not self._journal_path or not os.path.exists(self._journal_path):
+            return result
+        try:
+            with open(self._journal_path, "r", encoding="utf-8") as fobj:
+                for line in fobj:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        LOGGER.warning("Skipping broken request cache journal record")
+                        continue
+                    if len(record) == 2:
+                        result[record[0]] = record[1]
+                    else:
+                        result.pop(record[0], None)
+        except OSError:
+            LOGGER.exception("Failed to read request cache journal: ")
+        return result
+
+    def _close_journal(self):
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+
+    def _rewrite_journal(self):
+        if not self._journal_path:
+            return
+        self._close_journal()
+        tmp = self._journal_path + ".tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as fobj:
+                for request, expires in self._expirations.items():
+                    fobj.write(json.dumps([request, expires], ensure_ascii=False) + "\n")
+            os.replace(tmp, self._journal_path)
+        except OSError:
+            LOGGER.exception("Failed to write request cache journal: ")
+        self._journal_records = len(self._expirations)
+
+    def _append_journal(self, *record):
+        if not self._journal_path:
+            return
+        if self._journal_records > 2 * len(self._expirations) + 1024:
+            self._rewrite_journal()
+            return
+        try:
+            if self._journal is None:
+                self._journal = open(self._journal_path, "a", encoding="utf-8")
+            self._journal.write(json.dumps(list(record), ensure_ascii=False) + "\n")
+            self._journal.flush()
+            self._journal_records += 1
+        except OSError:
+            LOGGER.exception("Failed to append request cache journal: ")
+
+    @property
+    def size(self):
+        return self._bytes
+
+    def _expired(self, request):
+        expires = self._entries[request][1]
+        return expires is not None and expires <= time.time()
+
+    def _count(self, request, hits):
+        self._frequencies.setdefault(hits, OrderedDict())[request] = None
+        if hits < self._lowest or len(self._frequencies) == 1:
+            self._lowest = hits
+
+    def _uncount(self, request, hits):
+        bucket = self._frequencies.get(hits)
+        if bucket is None or request not in bucket:
+            return
+        del bucket[request]
+        if not bucket:
+            del self._frequencies[hits]
+            if hits == self._lowest and self._frequencies:
+                self._lowest = min(self._frequencies)
+
+    def _forget(self, request):
+        self._memory.remove(request)
+        entry = self._entries.pop(request, None)
+        if entry:
+            self._bytes -= entry[0]
+            self._uncount(request, entry[2])
+        if self._expirations.pop(request, None) is not None:
+            self._append_journal(request)
+
+    def _sweep(self):
+        """
+        Removes expired entries in order of expiration
+        """
+        now = time.time()
+        while self._deadlines and self._deadlines[0][0] <= now:
+            expires, request = heapq.heappop(self._deadlines)
+            entry = self._entries.get(request)
+            if entry is not None and entry[1] == expires:
+                LOGGER.debug(f"Request cache expired: {request}")
+                self._forget(request)
+                self._store.remove(request)
+
+    def _victim(self, keep=None):
+        """
+        :param keep: entry which was just inserted, it's evicted only if nothing else left
+        """
+        if self._eviction == "lfu":
+            for request in self._frequencies.get(self._lowest, ()):
+                if request != keep:
+                    return request
+            if len(self._frequencies) > 1:
+                hits = min(hits for hits in self._frequencies if hits != self._lowest)
+                return next(iter(self._frequencies[hits]))
+            return keep
+        for request in self._entries:
+            if request != keep:
+                return request
+        return keep
+
+    def _overflow(self):
+        return (self._max_entries is not None and len(self._entries) > self._max_entries) \
+            or (self._max_bytes is not None and self._bytes > self._max_bytes)
+
+    def _evict(self, keep=None):
+        while self._overflow() and self._entries:
+            request = self._victim(keep)
+            LOGGER.debug(f"Evicting request cache: {request}")
+            self._stats["evictions"] += 1
+            self._forget(request)
+            self._store.remove(request)
+
+    def reload(self):
+        with self._lock:
+            self._memory.clear()
+            self._store.reload()
+            self._track_stored()
+
+    def stats(self):
+        with self._lock:
+            result = dict(self._stats)
+            result.update({
+                "hits": self._stats["memory_hits"] + self._stats["disk_hits"],
+                "memory_evictions": self._memory.evictions,
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory.size,
+                "entries": len(self._entries),
+                "bytes": self._bytes
+            })
+            return result
+
+    def __contains__(self, request):
+        with self._lock:
+            return request in self._entries and not self._expired(request)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def find(self, request):
+        return self._store.find(request)
+
+    def path(self, request):
+        return self._store.path(request)
+
+    def lookup(self, request):
+        with self._lock:
+            self._sweep()
+            if request not in self._entries:
+                self._stats["misses"] += 1
+                return False, None
+            entry = self._entries[request]
+            hit, data = self._memory.get(request)
+            if hit:
+                self._stats["memory_hits"] += 1
+            else:
+                hit, data = self._store.lookup(request)
+                if not hit:
+                    self._stats["misses"] += 1
+                    self._forget(request)
+                    return False, None
+                self._stats["disk_hits"] += 1
+                self._memory.put(request, data, entry[0])
+            self._uncount(request, entry[2])
+            entry[2] += 1
+            self._count(request, entry[2])
+            self._entries.move_to_end(request)
+            return True, data
+
+    def put(self, request, data, ttl=None):
+        """
+        :param ttl: entry time to live in seconds, overrides global ttl
+        """
+        own = ttl is not None
+        ttl = ttl if own else self._ttl
+        with self._lock:
+            self._store.put(request, data)
+            self._forget(request)
+            size = _entry_size(request, data)
+            expires = time.time() + ttl if ttl else None
+            self._entries[request] = [size, expires, 0]
+            self._count(request, 0)
+            self._bytes += size
+            # own ttl 0 is written too, so global ttl isn't applied to entry after restart
+            if own or expires is not None:
+                self._expirations[request] = expires
+                self._append_journal(request, expires)
+            if expires is not None:
+                if len(self._deadlines) > 2 * len(self._entries) + 1024:
+                    self._deadlines = [(entry[1], key) for key, entry in self._entries.items()
+                                       if entry[1] is not None]
+                    heapq.heapify(self._deadlines)
+                heapq.heappush(self._deadlines, (expires, request))
+            self._memory.put(request, data, size)
+            self._sweep()
+            self._evict(keep=request)
+
+    def remove(self, request):
+        with self._lock:
+            self._forget(request)
+            return self._store.remove(request)
+
+    def close(self):
+        with self._lock:
+            self._close_journal()
+            self._store.close()
+
+    def clear(self):
+        with self._lock:
+            self._store.clear()
+            self._memory.clear()
+            self._entries.clear()
+            self._frequencies.clear()
+            self._deadlines.clear()
+            self._bytes = 0
+            self._expirations.clear()
+            self._rewrite_journal()
+
+
+def _entry_size(request, data):
+    return len(request.encode("utf-8")) + len(data.encode("utf-8"))
+
+
+def migrate_request_shards(store, path=REQUEST_CACHE):
+    """
+    Moves requests from JSON shards into another request store.
+    Shards are removed after successful import
+    """
+    shards = sorted(int(name) for name in os.listdir(path) if name.isdigit())
+    for number in shards:
+        shard = os.path.join(path, str(number))
+        try:
+            loaded = read_json(shard)
+        except (OSError, ValueError):
+            LOGGER.warning(f"Skipping broken request cache file: {number}")
+            continue
+        for request, data in loaded.items():
+            store.put(request, data)
+        os.remove(shard)
+        LOGGER.info(f"Migrated request cache file {number}: {len(loaded)} requests")
+
+
+def create_request_store(backend=REQUEST_CACHE_BACKEND, limits=REQUEST_CACHE_LIMITS,
+                         memory_bytes=REQUEST_CACHE_MEMORY):
+    """
+    Creates request store by backend name: "json" (shards) or "log" (append-only)
+    bounded by limits (see REQUEST_CACHE_LIMITS) with in-memory tier of memory_bytes size
+    """
+    if backend == "log":
+        store = LogRequestStore(REQUEST_LOG)
+        migrate_request_shards(store)
+    else:
+        if backend != "json":
+            LOGGER.error(f"Unknown request cache backend {backend}, using json")
+        store = ShardedRequestStore(REQUEST_CACHE)
+    return BoundedRequestStore(store, memory_bytes=memory_bytes, expirations=REQUEST_EXPIRATIONS,
+                               **limits)
+
+
+def _encode_response(data):
+    if isinstance(data, bytes):
+        return data.decode("utf-8")
+    return str(data)
+
+
+def put_request_cache(request, data, ttl=None):
     """
     Puts request to cache
     :param request: request string
     :param data: response data
+    :param ttl: time to live in seconds, if None - global REQUEST_CACHE_LIMITS ttl is used
     """
-    if isinstance(data, bytes):
-        data = data.decode("utf-8")
-    else:
-        data = str(data)
-    maxnumber = 0
-    for number in os.listdir(REQUEST_CACHE):
-        maxnumber = max(int(number), maxnumber)
-    file = os.path.join(REQUEST_CACHE, str(maxnumber))
-    if not os.path.exists(file):
-        write_json(file, {})
-    if os.path.getsize(file) > MAX_REQUEST_CACHE_SIZE:
-        maxnumber += 1
-        file = os.path.join(REQUEST_CACHE, str(maxnumber))
-        LOGGER.debug(f"Filling new request cache file: {maxnumber}")
-        write_json(file, {request: data})
-    else:
-        cache = read_json(file)
-        cache[request] = data
-        LOGGER.debug(f"Putting request cache file: {maxnumber}")
-        write_json(file, cache)
+    REQUEST_STORE.put(request, _encode_response(data), ttl)
+
+
+def lookup_request(request):
+    """
+    Looks request up in cache in one pass
+    :return: tuple (hit, response)
+    """
+    return REQUEST_STORE.lookup(request)
+
+
+def request_cache_stats():
+    """
+    Returns hit/miss/eviction counters and sizes of request cache tiers
+    """
+    return REQUEST_STORE.stats()
 
 
 def find_request(request):
     """
-    Returns a filename where storea response by passed request
+    Returns a filename where stored a response by passed request
     """
-    listdir = list(map(int, filter(lambda x: x.isdigit(), os.listdir(REQUEST_CACHE))))
-    listdir.sort(reverse=True)
-    for number in listdir:
-        loaded = read_json(os.path.join(REQUEST_CACHE, f"{number}"))
-        if request in loaded:
-            LOGGER.debug(f"Request {request} has found in cache")
-            return str(number)
+    number = REQUEST_STORE.find(request)
+    if number is not None:
+        return str(number)
     return None
 
 
@@ -131,7 +659,7 @@ def put_module_cache(module, filename, data: bytes):
 
 
 def is_request_cached(request_addr):
-    return find_request(request_addr) is not None
+    return request_addr in REQUEST_STORE
 
 
 def is_module_cached(module, filename):
@@ -152,13 +680,11 @@ def get_module_cached(module, filename):
 
 
 def get_request_cached(request_addr):
-    path = os.path.join(REQUEST_CACHE, find_request(request_addr))
-    data = read_json(path)
-    return data[request_addr]
+    return REQUEST_STORE.lookup(request_addr)[1]
 
 
 def request_path(request_addr):
-    return os.path.join(REQUEST_CACHE, find_request(request_addr))
+    return REQUEST_STORE.path(request_addr)
 
 
 def module_path(name):
@@ -169,6 +695,7 @@ def cleanup(force=False):
     """
     Cleanup cache excluding ALLOWED_CACHE directory names
     """
+    REQUEST_STORE.close()
     for root, _, files in os.walk(PATH):
         for file in files:
             path = os.path.join(root, file)
@@ -181,6 +708,7 @@ def cleanup(force=False):
                     LOGGER.debug(f"Cleaning {path}")
                 except PermissionError:
                     LOGGER.info(f"Skipping {path} due to PermissionError")
+    REQUEST_STORE.reload()
 
 
 def remove_module_cache(module, filename):
@@ -190,13 +718,7 @@ def remove_module_cache(module, filename):
 
 
 def remove_request_cached(request_addr):
-    path = os.path.join(REQUEST_CACHE, find_request(request_addr))
-    with open(path, "rb") as fobj:
-        data = json.load(fobj)
-    data.pop(request_addr)
-    with open(path, "wb") as fobj:
-        json.dump(fobj, data)
-    LOGGER.debug(f"Removing {request_addr}")
+    return REQUEST_STORE.remove(request_addr)
 
 
 def get_shared_cache():
@@ -224,4 +746,5 @@ def remove_allowed_cache(modulename):
         write_json(pth, ALLOWED_CACHE)
 
 
-ALLOWED_CACHE = load_allowed_cache()
\ No newline at end of file
+ALLOWED_CACHE = load_allowed_cache()
+REQUEST_STORE = create_request_store()
@@ -1,4 +1,8 @@
 import json
+from collections.abc import Mapping
+from threading import RLock
+from types import MappingProxyType, MethodType
+from weakref import WeakMethod
 
 from . import appconfig
 import os.path
@@ -10,21 +14,82 @@ LOGGER = get_logger("config")
 
 class Config:
     """
-    App configuration object
+    App configuration object. Both layers are flat maps of dotted names
+    ("namespace.name.key"), nested dicts are returned as immutable snapshots.
+    Hot readers subscribe to names instead of reading them repeatedly
     """
     def __init__(self):
         LOGGER.info("Creating config object")
         self._dyn = {}  # dynamic, changeable configs
         self._static = {}  # static configs, constant config
+        self._children = {}  # dict name -> {child name: original key}
+        self._namespaces = set()
+        self._names = {}  # requested name -> (flat name, namespace)
+        self._snapshots = {}  # flat name of dict -> immutable snapshot
+        self._subscribers = {}  # flat name -> list of (name, callback or weak method)
+        self._file = {}  # configs loaded from config.txt
+        self._file_defaults = {}  # values which were overridden by config.txt
+        self._lock = RLock()
+
+    def _link(self, name, key=None):
+        """
+        Registers name in children of its parent, so snapshot of parent contains it
+        """
+        parent, _, child = name.rpartition(".")
+        while parent:
+            children = self._children.setdefault(parent, {})
+            if name in children:
+                return
+            children[name] = child if key is None else key
+            name, key = parent, None
+            parent, _, child = name.rpartition(".")
+        if name not in self._namespaces:
+            self._namespaces.add(name)
+            self._namespace_added()
+
+    def _namespace_added(self):
+        """
+        Names which were resolved before namespace existed belong to globals,
+        so resolved names are forgotten and subscribers are keyed again
+        """
+        self._names.clear()
+        subscribers = self._subscribers
+        self._subscribers = {}
+        for items in subscribers.values():
+            for name, reference in items:
+                self._subscribers.setdefault(self._key(name)[0], []).append((name, reference))
+
+    def _flatten(self, layer, name, value, key=None):
+        self._link(name, key)
+        if isinstance(value, Mapping):
+            self._children.setdefault(name, {})
+            for child, item in value.items():
+                self._flatten(layer, f"{name}.{str(child).lower()}", item, child)
+        else:
+            layer[name] = value
+
+    def _exists(self, name):
+        return name in self._static or name in self._dyn or bool(self._children.get(name))
+
+    def _discard(self, layer, name):
+        """
+        Removes name and all its children from layer, forgets nodes which are left empty.
+        Walks only subtree of name by children index
+        """
+        layer.pop(name, None)
+        children = self._children.get(name)
+        if not children:
+            return
+        for child in list(children):
+            self._discard(layer, child)
+        for child in [child for child in children if not self._exists(child)]:
+            del children[child]
+            self._children.pop(child, None)
 
     def _put(self, name, value, module="globals", dest="dyn"):
         LOGGER.debug(f"Internal method call: adding {name}={value} to module {module} in {dest}")
-        name = name.lower()
-        module = module.lower()
         dest = self._static if dest == "static" else self._dyn
-        if module not in dest:
-            dest[module] = {}
-        dest[module][name] = value
+        self._flatten(dest, f"{module.lower()}.{name.lower()}", value, name.lower())
 
     @staticmethod
     def _convert(value):
@@ -41,12 +106,16 @@ class Config:
                 return False
         return str(value)
 
-    def load_configfile(self):
-        LOGGER.info("Loading configs from configuration file")
+    @staticmethod
+    def read_configfile():
+        """
+        :return: dict name -> converted value from config.txt, None if file doesn't exist
+        """
         path = os.path.join(appconfig.DATA_PATH, "config.txt")
         if not os.path.exists(path):
             LOGGER.info("config.txt wasn't found")
-            return
+            return None
+        configs = {}
         with open(path, "r") as fobj:
             lines = fobj.read().strip().split("\n")
         for line in lines:
@@ -54,7 +123,25 @@ class Config:
             if len(config) > 1:
                 name = config[0].strip()
                 value = config[1].strip()
-                self.put(name, self._convert(value), None)
+                configs[name] = Config._convert(value)
+        return configs
+
+    def load_configfile(self):
+        """
+        Applies config.txt over current configs. Configs removed from file
+        since previous call are restored to values they had before
+        """
+        LOGGER.info("Loading configs from configuration file")
+        configs = self.read_configfile() or {}
+        for name in [name for name in self._file if name not in configs]:
+            self.put(name, self._file_defaults.pop(name), None)
+        for name, value in configs.items():
+            if name not in self._file:
+                self._file_defaults[name] = self.absolute_cfg(name)
+            elif self._file[name] == value:
+                continue
+            self.put(name, value, None)
+        self._file = configs
 
     def load(self, app):
         """
@@ -62,123 +149,185 @@ class Config:
         """
         modules, extensions, inputservices = app.modules, app.extensions, app.input_services
         LOGGER.info("Loading configs...")
+        with self._lock:
+            self._load(modules, extensions, inputservices)
+        self._notify(list(self._subscribers))
+
+    def _load(self, modules, extensions, inputservices):
         self._dyn.clear()
         self._static.clear()
+        self._children.clear()
+        self._namespaces.clear()
+        self._names.clear()
+        self._snapshots.clear()
+        self._file = {}
+        self._file_defaults.clear()
         for name in appconfig.ALLOWED_FOR_CHANGE:
             self._put(name, appconfig.__getattribute__(name))
         for name in dir(appconfig):
             if name not in appconfig.ALLOWED_FOR_CHANGE and not name.startswith("_"):
                 self._put(name, appconfig.__getattribute__(name), "globals", "static")
+        # lazy module table gives manifest configs without importing modules,
+        # imported ones are hooked when they are materialized
+        loaded = getattr(modules, "loaded", None)
         for name in modules:
-            module = modules[name]
-            cfg = module.configs
-            allowed = cfg.get("ALLOWED_FOR_CHANGE")
-            for param_name in cfg:
-                dest = "dyn"
-                if allowed is not None:
-                    if param_name not in allowed:
-                        dest = "static"
-                self._put(param_name, cfg[param_name], name, dest)
+            if loaded is None or loaded(name):
+                self._put_configs(name, modules[name].configs)
+                modules[name].on_configs_changed(self.reload_plugin)
+            else:
+                self._put_configs(name, modules.peek(name))
         for name in extensions:
-            ext = extensions[name].build(None)
-            cfg = ext.configs
-            allowed = cfg.get("ALLOWED_FOR_CHANGE")
-            for param_name in cfg:
-                dest = "dyn"
-                if allowed is not None:
-                    if param_name not in allowed:
-                        dest = "static"
-                self._put(param_name, cfg[param_name], name, dest)
+            cfg = extensions[name].manifest() if appconfig.LAZY_PLUGINS else None
+            if cfg is None:
+                shared = extensions[name].shared()
+                cfg = shared.configs
+                shared.on_configs_changed(self.reload_plugin)
+            self._put_configs(name, cfg)
         for name in inputservices:
             inputservice = inputservices[name]
-            cfg = inputservice.configs
-            allowed = cfg.get("ALLOWED_FOR_CHANGE")
-            for param_name in cfg:
-                dest = "dyn"
-                if allowed is not None:
-                    if param_name not in allowed:
-                        dest = "static"
-                self._put(param_name, cfg[param_name], name, dest)
+            self._put_configs(name, inputservice.configs)
+            inputservice.on_configs_changed(self.reload_plugin)
         self.load_configfile()
 
-    def route(self, abscfg):
+    def _put_configs(self, name, cfg):
         """
-        Find absolute config without access restrictions
+        Puts configs of plugin into its namespace, ALLOWED_FOR_CHANGE ones are dynamic
         """
-        LOGGER.info(f"Rounting configuration: {abscfg}")
-        path = self.sep_namespace(abscfg)
-        tmp = self._static
-        for ns in path:
-            if tmp is None:
-                break
-            else:
-                tmp = tmp.get(ns)
-        if tmp is not None:
-            return tmp
-        else:
-            LOGGER.debug("Configuration wasn't found in static config")
-            tmp = self._dyn
-            for ns in path:
-                if tmp is None:
-                    break
-                else:
-                    tmp = tmp.get(ns)
-            return tmp
+        allowed = cfg.get("ALLOWED_FOR_CHANGE")
+        for param_name in cfg:
+            dest = "dyn"
+            if allowed is not None:
+                if param_name not in allowed:
+                    dest = "static"
+            self._put(param_name, cfg[param_name], name, dest)
+
+    def _invalidate(self, key):
+        """
+        Drops snapshots affected by change of key
+        :return: subscribed names which must be notified
+        """
+        for name in list(self._snapshots):
+            if name == key or name.startswith(key + ".") or key.startswith(name + "."):
+                del self._snapshots[name]
+        return [name for name in self._subscribers
+                if name == key or name.startswith(key + ".") or key.startswith(name + ".")]
+
+    def reload_plugin(self, plugin):
+        """
+        Replaces configs of plugin after it changed them, values from config.txt keep priority.
+        Called by plugin when its configs are invalidated
+        """
+        LOGGER.info(f"Reloading configs of {plugin.name}")
+        namespace = plugin.name.lower()
+        cfg = plugin.configs
+        with self._lock:
+            self._discard(self._static, namespace)
+            self._discard(self._dyn, namespace)
+            self._put_configs(plugin.name, cfg)
+            changed = self._invalidate(namespace)
+            for name, value in self._file.items():
+                key = self._key(name)[0]
+                if key.startswith(namespace + "."):
+                    self._file_defaults[name] = self.absolute_cfg(name)
+                    self._discard(self._dyn, key)
+                    self._flatten(self._dyn, key, value)
+                    self._invalidate(key)
+        self._notify(changed)
 
     def sep_namespace(self, name):
         name = name.lower().split(".")
         if len(name) == 1:
             return "globals", *name
         else:
-            if name[0] in self._dyn or name[0] in self._static:
+            if name[0] in self._namespaces:
                 return name[0], *name[1:]
             else:
                 return "globals", *name
 
+    def _key(self, name):
+        """
+        :return: tuple (flat name, namespace)
+        """
+        key = self._names.get(name)
+        if key is None:
+            lowered = name.lower()
+            if lowered in self._namespaces:
+                key = lowered, lowered
+            else:
+                path = self.sep_namespace(name)
+                key = ".".join(path), path[0]
+            self._names[name] = key
+        return key
+
+    def _snapshot(self, name):
+        snapshot = self._snapshots.get(name)
+        if snapshot is None:
+            with self._lock:
+                snapshot = MappingProxyType({key: self._read(child)
+                                             for child, key in self._children[name].items()})
+                self._snapshots[name] = snapshot
+        return snapshot
+
+    def _read(self, name):
+        value = self._static.get(name)
+        if value is None:
+            value = self._dyn.get(name)
+        if value is None and name in self._children:
+            return self._snapshot(name)
+        return value
+
+    def route(self, abscfg):
+        """
+        Find absolute config without access restrictions
+        """
+        return self._read(self._key(abscfg)[0])
+
     def absolute_cfg(self, name, module=None):
-        LOGGER.info(f"Getting absolute configuration {name} for module={module}")
-        if name not in dir(appconfig):
-            if name in list(self._dyn.keys()) and name in list(self._static.keys()):
-                temp = dict(self._dyn[name])
-                temp.update(self._static[name])
-                return temp
-            elif name in list(self._dyn.keys()):
-                return dict(self._dyn[name])
-            elif name in list(self._static.keys()):
-                dict(self._dyn[name])
-        path = self.sep_namespace(name)
-        result = self.route(name)
-        if isinstance(result, dict):
-            result = result.copy()
-        if module is not None:
-            if path[0] == "globals" or path[0] == module.name.lower():
-                return result
-        else:
-            return result
+        key, namespace = self._key(name)
+        if module is not None and namespace != "globals" and namespace != module.name.lower():
+            return None
+        return self._read(key)
 
     def put(self, name, value, module=None):
         LOGGER.info(f"Put new configuration: {name}={value} with module={module}")
-        path = self.sep_namespace(name)
-        tmp = self._dyn
-        if path[0] not in self._dyn:
-            tmp = tmp.get("globals")
-        else:
-            tmp = tmp.get(path[0])
-        for item in path[1:-1]:
-            if tmp.get(item) is None:
-                tmp[item] = {}
-            tmp = tmp.get(item)
+        key, namespace = self._key(name)
         if module is not None:
-            if path[0] != "globals" and path[0] != module.name.lower():
+            if namespace != "globals" and namespace != module.name.lower():
                 return
-        tmp[path[-1]] = value
+        with self._lock:
+            self._discard(self._dyn, key)
+            self._flatten(self._dyn, key, value)
+            changed = self._invalidate(key)
+        self._notify(changed)
 
     def relative_cfg(self, name, module):
         LOGGER.info(f"Getting relative configuration for module={module}, name={name}")
         if name.strip() == '':
-            return dict(self._dyn[module.name.lower()])
+            namespace = module.name.lower()
+            return self._snapshot(namespace) if namespace in self._children else None
         else:
             modulecfg = ".".join([module.name.lower(), name.lower()])
             globalcfg = ".".join(["globals", name.lower()])
             return self.absolute_cfg(modulecfg) or self.absolute_cfg(globalcfg)
 
+    def subscribe(self, name, callback):
+        """
+        Calls callback with new value every time config, its parent or its child is changed.
+        Bound methods are kept by weak references, so subscribers may be collected
+        :return: current value
+        """
+        key = self._key(name)[0]
+        reference = WeakMethod(callback) if isinstance(callback, MethodType) else callback
+        with self._lock:
+            subscribers = self._subscribers.setdefault(key, [])
+            subscribers[:] = [(subscribed, item) for subscribed, item in subscribers
+                              if not isinstance(item, WeakMethod) or item() is not None]
+            subscribers.append((name, reference))
+        return self.absolute_cfg(name)
+
+    def _notify(self, keys):
+        for key in keys:
+            for name, reference in list(self._subscribers.get(key, ())):
+                callback = reference() if isinstance(reference, WeakMethod) else reference
+                if callback is not None:
+                    callback(self.absolute_cfg(name))
@@ -1,8 +1,9 @@
 from .appconfig import APP_VERSION, APP_VERSION_NAME, API_VERSION
 import os
 import json
+from contextvars import ContextVar
 from . import cache
-from .import_service import load_py_from
+from .import_service import SUBMODULES, resolve_path, submodule_path
 from . import pipe
 from .logger import get_logger
 
@@ -67,6 +68,12 @@ class ModuleContext:
         else:
             cache.remove_allowed_cache(self._module.name)
 
+    def settings_changed(self):
+        """
+        Must be called after changing SETTINGS at runtime, configs are rebuilt on next access
+        """
+        self._module.invalidate_configs()
+
     @property
     def mnemonics(self):
         return self._mnems, self._custom_mnems
@@ -78,6 +85,10 @@ class ModuleContext:
     def get_shared_cache():
         return cache.get_shared_cache()
 
+    @property
+    def request_cache_stats(self):
+        return cache.request_cache_stats()
+
     def is_mnemonic(self, mnem):
         return mnem in self._mnems or mnem in self._mnems
 
@@ -109,10 +120,11 @@ class ModuleContext:
 
     def import_submodule(self, module_name):
         LOGGER.info("Importing submodule %s" % module_name)
-        # module name without py
-        module_name = module_name.replace(".py", "") + ".py"
-        module = load_py_from(os.path.join(self._module.path, module_name))
-        return module
+        return SUBMODULES.load(submodule_path(self._module.path, module_name))
+
+    def reload_submodule(self, module_name):
+        LOGGER.info("Reloading submodule %s" % module_name)
+        return SUBMODULES.reload(submodule_path(self._module.path, module_name))
 
     def redefine_vsuggestions(self, commands):
         self._module._vsuggestions = commands
@@ -186,11 +198,11 @@ class ModuleContext:
 
     def import_submodule_by_path(self, path):
         LOGGER.info("Importing submodule: %s" % path)
-        prevcwd = os.getcwd()
-        os.chdir(self._module.path)
-        module = load_py_from(os.path.abspath(path))
-        os.chdir(prevcwd)
-        return module
+        return SUBMODULES.load(resolve_path(self._module.path, path))
+
+    def reload_submodule_by_path(self, path):
+        LOGGER.info("Reloading submodule: %s" % path)
+        return SUBMODULES.reload(resolve_path(self._module.path, path))
 
     def absolute_cfg(self, name):
         return self._cfg.absolute_cfg(name, module=self._module)
@@ -282,20 +294,28 @@ class ExtensionContext:
         else:
             return os.path.join(self._module.path, path)
 
+    def _base_path(self):
+        """
+        Relative submodule paths are resolved against module, shared and singleton
+        extensions have no module, so against extension
+        """
+        return self._module.path if self._module is not None else self._extension.path
+
     def import_submodule_by_path(self, path):
         LOGGER.info("Importing submodule: %s" % path)
-        prevcwd = os.getcwd()
-        os.chdir(self._module.path)
-        module = load_py_from(os.path.abspath(path))
-        os.chdir(prevcwd)
-        return module
+        return SUBMODULES.load(resolve_path(self._base_path(), path))
+
+    def reload_submodule_by_path(self, path):
+        LOGGER.info("Reloading submodule: %s" % path)
+        return SUBMODULES.reload(resolve_path(self._base_path(), path))
 
     def import_submodule(self, module_name):
         LOGGER.info("Importing submodule: %s" % module_name)
-        # module name without py
-        module_name = module_name.replace(".py", "") + ".py"
-        module = load_py_from(os.path.join(self._extension.path, module_name))
-        return module
+        return SUBMODULES.load(submodule_path(self._extension.path, module_name))
+
+    def reload_submodule(self, module_name):
+        LOGGER.info("Reloading submodule: %s" % module_name)
+        return SUBMODULES.reload(submodule_path(self._extension.path, module_name))
 
     def put_cache(self, filename, data):
         LOGGER.info("Adding new cache %s" % filename)
@@ -342,6 +362,33 @@ class ExtensionContext:
         return self._cfg.put(name, value, module=self._extension)
 
 
+class ExtensionContextBinding:
+    """
+    ctx of extension module, which is executed once and shared by all consumers.
+    Attributes are taken from context of consumer whose call is running,
+    from context of extension without paired module otherwise
+    """
+
+    def __init__(self, name):
+        self.default = None
+        self._current = ContextVar(f"extension_context:{name}", default=None)
+
+    def bind(self, context):
+        """
+        :return: token for unbind
+        """
+        return self._current.set(context)
+
+    def unbind(self, token):
+        self._current.reset(token)
+
+    def get(self):
+        return self._current.get() or self.default
+
+    def __getattr__(self, attr):
+        return getattr(self.get(), attr)
+
+
 class InputContext:
     def __init__(self, hook=None):
         LOGGER.debug("Created input context")
@@ -406,6 +453,12 @@ class InputServiceContext:
         else:
             cache.remove_allowed_cache(self._inputservice.name)
 
+    def settings_changed(self):
+        """
+        Must be called after changing SETTINGS at runtime, configs are rebuilt on next access
+        """
+        self._inputservice.invalidate_configs()
+
     def fork(self):
         return self._app
 
@@ -519,11 +572,11 @@ class InputServiceContext:
 
     def import_submodule_by_path(self, path):
         LOGGER.info("Importing submodule: %s" % path)
-        prevcwd = os.getcwd()
-        os.chdir(self._inputservice.path)
-        module = load_py_from(os.path.abspath(path))
-        os.chdir(prevcwd)
-        return module
+        return SUBMODULES.load(resolve_path(self._inputservice.path, path))
+
+    def reload_submodule_by_path(self, path):
+        LOGGER.info("Reloading submodule: %s" % path)
+        return SUBMODULES.reload(resolve_path(self._inputservice.path, path))
 
     def internal_path(self, path=None):
         LOGGER.info("Resolving internal path: %s" % path)
@@ -534,11 +587,11 @@ class InputServiceContext:
 
     def import_submodule(self, module_name):
         LOGGER.info("Importing submodule %s" % module_name)
-        # module name without py
-        module_name = module_name.replace(".py", "") + ".py"
-        module = load_py_from(os.path.join(
-            self._inputservice.path, module_name))
-        return module
+        return SUBMODULES.load(submodule_path(self._inputservice.path, module_name))
+
+    def reload_submodule(self, module_name):
+        LOGGER.info("Reloading submodule %s" % module_name)
+        return SUBMODULES.reload(submodule_path(self._inputservice.path, module_name))
 
 
 class DeliveryServiceContext:
@@ -565,6 +618,12 @@ class DeliveryServiceContext:
         else:
             cache.remove_allowed_cache(self._delservice.name)
 
+    def settings_changed(self):
+        """
+        Must be called after changing SETTINGS at runtime, configs are rebuilt on next access
+        """
+        self._delservice.invalidate_configs()
+
     def extension(self, name):
         LOGGER.info("Using extension %s" % name)
         if name not in self._builded_ext:
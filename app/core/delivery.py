@@ -1,17 +1,58 @@
-from .storage import lookup_services_path
 from .models import DeliveryService
+from .pipeline import is_stream
+from .utils import call_maybe_async
+from .dispatch import ServiceDispatcher, LatencyStats, timed_call, sent_packets
 from . import import_service
 import os
+import time
 from .logger import get_logger
 
 
 LOGGER = get_logger("delivery")
+STATS = LatencyStats()
+DISPATCHER = None  # set in parallel delivery mode
+LATENCY_REPORT = False  # log latency report after every rolled pipeline
+
+
+def configure_dispatch(mode="sequential", workers=4, timeout=5):
+    """
+    Chooses how packets are sent to delivery services
+    :param mode: sequential - services are called one by one,
+    parallel - services are called concurrently from worker pool
+    :param workers: size of worker pool
+    :param timeout: default time in seconds to wait for one service call
+    """
+    global DISPATCHER
+    shutdown_dispatch()
+    if mode == "parallel":
+        DISPATCHER = ServiceDispatcher(workers, timeout, stats=STATS)
+    elif mode != "sequential":
+        LOGGER.error(f"Unknown delivery mode {mode}, using sequential")
+
+
+def shutdown_dispatch():
+    global DISPATCHER
+    if DISPATCHER is not None:
+        DISPATCHER.shutdown()
+        DISPATCHER = None
+
+
+def delivery_stats():
+    """
+    Returns per-service delivery latency report
+    """
+    return STATS.report()
 
 
 def load_services(app):
+    global LATENCY_REPORT
     LOGGER.debug("Loading delivery services...")
+    LATENCY_REPORT = bool(app.config.absolute_cfg("delivery_latency_report"))
+    configure_dispatch(app.config.absolute_cfg("delivery_mode"),
+                       app.config.absolute_cfg("delivery_workers"),
+                       app.config.absolute_cfg("delivery_timeout"))
     imported = []
-    paths = lookup_services_path("delivery_services")
+    paths = app.manifest.lookup_services_path("delivery_services")
     for path in paths:
         name = os.path.basename(path).replace(".py", "")
         imported.append(DeliveryService(name, import_service.load_py_from(path), path, app))
@@ -57,6 +98,8 @@ def handle_response(obj, pipeline, module, config):
             return "empty"
     elif isinstance(obj, list) or isinstance(obj, tuple):
         return obj
+    elif is_stream(obj):
+        return obj
     else:
         if config.absolute_cfg("only_string_io_data"):
             return str(obj)
@@ -64,46 +107,148 @@ def handle_response(obj, pipeline, module, config):
             return obj
 
 
+def _call(services, method, *args):
+    if DISPATCHER is not None:
+        DISPATCHER.call(services, method, *args)
+    else:
+        for service in services:
+            timed_call(service, method, STATS, *args)
+
+
+async def _call_async(services, method, *args):
+    if DISPATCHER is not None:
+        await DISPATCHER.call_async(services, method, *args)
+    else:
+        for service in services:
+            started = time.monotonic()
+            await getattr(service, method + "_async")(*args)
+            STATS.record(service.name, time.monotonic() - started, packets=sent_packets(method, args))
+
+
 def sendto(packet, services):
-    for service in services:
-        service.send(packet)
+    _call(services, "send", packet)
+
+
+def sendto_batch(packets, services):
+    if packets:
+        _call(services, "send_batch", packets)
 
 
 def begin(services):
-    for service in services:
-        service.begin()
+    _call(services, "begin")
 
 
 def finished(services, cnt):
-    for service in services:
-        service.finished(cnt)
+    _call(services, "finished", cnt)
+
+
+async def sendto_async(packet, services):
+    await _call_async(services, "send", packet)
+
+
+async def sendto_batch_async(packets, services):
+    if packets:
+        await _call_async(services, "send_batch", packets)
+
+
+async def begin_async(services):
+    await _call_async(services, "begin")
+
+
+async def finished_async(services, cnt):
+    await _call_async(services, "finished", cnt)
+
+
+class PacketBatch:
+    """
+    Collects packets for delivery services with send_batch hook,
+    other services get every packet immediately
+    """
+
+    def __init__(self, pipeline, services):
+        self.single = [service for service in services if not service.batching]
+        self.batched = [service for service in services if service.batching]
+        self.window = pipeline.configuration["packets_count"]
+        self.packets = []
+
+    def add(self, packet):
+        """
+        :return: True if batch window is full and batch must be flushed
+        """
+        if self.batched:
+            self.packets.append(packet)
+        return len(self.packets) >= self.window
+
+    def take(self):
+        packets, self.packets = self.packets, []
+        return packets
+
+
+async def roll_pipeline_async(pipeline, services, user_action=None):
+    """
+    Asynchronous variant of roll_pipeline: delays don't block event loop,
+    coroutine send/begin/finished of delivery services and user action are awaited
+    """
+    LOGGER.info("Rolling pipeline asynchronously...")
+    debug_packet_count = 0
+    debug_packet_length = 0
+    if pipeline.is_specific_source():
+        await sendto_async(pipeline.source, services)
+    elif pipeline.is_filled():
+        LOGGER.debug("Pipeline is filled.")
+        batch = PacketBatch(pipeline, services)
+        await begin_async(services)
+        async for packet in pipeline:
+            if packet != "$:USER_ACTION":
+                debug_packet_length += len(packet)
+                debug_packet_count += 1
+                await sendto_async(packet, batch.single)
+                if batch.add(packet):
+                    await sendto_batch_async(batch.take(), batch.batched)
+            elif user_action:
+                LOGGER.debug("Calling user action")
+                await sendto_batch_async(batch.take(), batch.batched)
+                await finished_async(services, pipeline.packets_sent)
+                await begin_async(services)
+                if not await call_maybe_async(user_action):
+                    break
+        await sendto_batch_async(batch.take(), batch.batched)
+        await finished_async(services, pipeline.packets_sent)
+    LOGGER.info("Packet delivery finished. Sent {} packets with length {}".format(debug_packet_count, debug_packet_length))
+    if LATENCY_REPORT:
+        LOGGER.debug("Delivery latency: %s", STATS.report())
+    pipeline.reset()
 
 
 def roll_pipeline(pipeline, services, user_action=None):
     LOGGER.info("Rolling pipeline...")
+    debug_packet_count = 0
+    debug_packet_length = 0
     if pipeline.is_specific_source():
         sendto(pipeline.source, services)
     else:
-        debug_packet_count = 0
-        debug_packet_length = 0
         if pipeline.is_filled():
             LOGGER.debug("Pipeline is filled.")
-            for service in services:
-                service.begin()
+            batch = PacketBatch(pipeline, services)
+            begin(services)
             for packet in pipeline:
                 if packet != "$:USER_ACTION":
                     debug_packet_length += len(packet)
                     debug_packet_count += 1
-                    sendto(packet, services)
+                    sendto(packet, batch.single)
+                    if batch.add(packet):
+                        sendto_batch(batch.take(), batch.batched)
                 else:
                     if user_action:
                         LOGGER.debug("Calling user action")
-                        for service in services:
-                            service.finished(pipeline.packets_sent)
-                            service.begin()
+                        sendto_batch(batch.take(), batch.batched)
+                        finished(services, pipeline.packets_sent)
+                        begin(services)
                         if not user_action():
                             break
-            for service in services:
-                service.finished(pipeline.packets_sent)
+            sendto_batch(batch.take(), batch.batched)
+            finished(services, pipeline.packets_sent)
     LOGGER.info("Packet delivery finished. Sent {} packets with length {}".format(debug_packet_count, debug_packet_length))
+    if LATENCY_REPORT:
+        LOGGER.debug("Delivery latency: %s", STATS.report())
     pipeline.reset()
@@ -0,0 +1,222 @@
+import time
+import asyncio
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from threading import Lock
+from .logger import get_logger
+
+
+LOGGER = get_logger("dispatch")
+
+
+class LatencyStats:
+    """
+    Per delivery service latency accounting
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._services = {}
+
+    def _entry(self, name):
+        if name not in self._services:
+            self._services[name] = {"calls": 0, "errors": 0, "timeouts": 0, "dropped": 0,
+                                    "sends": 0, "packets": 0,
+                                    "total": 0.0, "max": 0.0, "last": 0.0}
+        return self._services[name]
+
+    def record(self, name, seconds, failed=False, packets=None):
+        """
+        :param packets: count of packets delivered by call, None if call isn't sending
+        """
+        with self._lock:
+            entry = self._entry(name)
+            entry["calls"] += 1
+            if packets is not None:
+                entry["sends"] += 1
+                entry["packets"] += packets
+            entry["errors"] += int(failed)
+            entry["total"] += seconds
+            entry["last"] = seconds
+            entry["max"] = max(entry["max"], seconds)
+
+    def count(self, name, counter):
+        with self._lock:
+            self._entry(name)[counter] += 1
+
+    def report(self):
+        """
+        :return: dict service name -> calls, errors, timeouts, dropped,
+        packets, packets_per_call, mean_ms, max_ms, last_ms
+        """
+        with self._lock:
+            result = {}
+            for name, entry in self._services.items():
+                result[name] = {
+                    "calls": entry["calls"],
+                    "errors": entry["errors"],
+                    "timeouts": entry["timeouts"],
+                    "dropped": entry["dropped"],
+                    "packets": entry["packets"],
+                    "packets_per_call": round(entry["packets"] / entry["sends"], 2) if entry["sends"] else 0.0,
+                    "mean_ms": round(entry["total"] * 1000 / entry["calls"], 3) if entry["calls"] else 0.0,
+                    "max_ms": round(entry["max"] * 1000, 3),
+                    "last_ms": round(entry["last"] * 1000, 3)
+                }
+            return result
+
+    def reset(self):
+        with self._lock:
+            self._services.clear()
+
+
+def sent_packets(method, args):
+    """
+    Returns count of packets delivered by call of delivery service method
+    """
+    if method == "send":
+        return 1
+    elif method == "send_batch":
+        return len(args[0])
+    return None
+
+
+def timed_call(service, method, stats, *args):
+    """
+    Calls method of delivery service and records its latency
+    """
+    started = time.monotonic()
+    failed = True
+    try:
+        result = getattr(service, method)(*args)
+        failed = False
+        return result
+    finally:
+        stats.record(service.name, time.monotonic() - started, failed, sent_packets(method, args))
+
+
+class ServiceLane:
+    """
+    Ordered queue of calls to one delivery service. Only one call of lane
+    runs at a time, so packets reach service in order they were sent
+    """
+
+    def __init__(self, service, executor, stats, timeout, backlog):
+        self.service = service
+        self.timeout = service.configs.get("DELIVERY_TIMEOUT", timeout)
+        self.overdue = False  # previous call timed out and still hasn't finished
+        self._executor = executor
+        self._stats = stats
+        self._backlog = backlog
+        self._calls = deque()
+        self._running = False
+        self._lock = Lock()
+
+    @property
+    def name(self):
+        return self.service.name
+
+    def submit(self, method, *args):
+        future = Future()
+        with self._lock:
+            if len(self._calls) >= self._backlog:
+                LOGGER.warning(f"Delivery service {self.name} backlog is full, dropping {method} call")
+                self._stats.count(self.name, "dropped")
+                future.set_result(None)
+                return future
+            self._calls.append((future, method, args))
+            if not self._running:
+                self._running = True
+                self._executor.submit(self._run_next)
+        return future
+
+    def _run_next(self):
+        # one call per worker task, so long backlog of slow service doesn't starve other lanes
+        future, method, args = self._calls.popleft()
+        try:
+            future.set_result(timed_call(self.service, method, self._stats, *args))
+        except Exception as e:
+            future.set_exception(e)
+        with self._lock:
+            if self._calls:
+                self._executor.submit(self._run_next)
+            else:
+                self._running = False
+                self.overdue = False
+
+
+class ServiceDispatcher:
+    """
+    Calls delivery services concurrently on bounded worker pool.
+    Every service has own ordered lane, dispatcher waits for each service
+    no longer than its timeout (DELIVERY_TIMEOUT setting of service)
+    """
+
+    def __init__(self, workers=4, timeout=5, backlog=256, stats=None):
+        LOGGER.debug(f"Creating delivery dispatcher with {workers} workers")
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="dispatch")
+        self._timeout = timeout
+        self._backlog = backlog
+        self._stats = stats or LatencyStats()
+        self._lanes = {}
+        self._lock = Lock()
+
+    def lane(self, service):
+        with self._lock:
+            if service not in self._lanes:
+                self._lanes[service] = ServiceLane(service, self._executor, self._stats,
+                                                   self._timeout, self._backlog)
+            return self._lanes[service]
+
+    def _expired(self, lane, method):
+        lane.overdue = True
+        self._stats.count(lane.name, "timeouts")
+        LOGGER.warning(f"Delivery service {lane.name} hasn't finished {method} in {lane.timeout}s")
+
+    def _submit(self, services, method, args):
+        submitted = []
+        for lane in map(self.lane, services):
+            # lane which is still behind is not waited, its calls stay in order
+            wait = not lane.overdue
+            submitted.append((lane, lane.submit(method, *args), wait))
+        return submitted
+
+    def call(self, services, method, *args):
+        """
+        Calls method of every service and waits until calls are finished or timed out
+        """
+        started = time.monotonic()
+        for lane, future, wait in self._submit(services, method, args):
+            if not wait:
+                continue
+            remaining = None
+            if lane.timeout is not None:
+                remaining = max(0, started + lane.timeout - time.monotonic())
+            try:
+                future.result(remaining)
+            except FutureTimeout:
+                self._expired(lane, method)
+            except Exception:
+                LOGGER.exception(f"Delivery service with name {lane.name} exception: ")
+
+    async def _wait_async(self, lane, future, method):
+        try:
+            await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), lane.timeout)
+        except asyncio.TimeoutError:
+            self._expired(lane, method)
+        except Exception:
+            LOGGER.exception(f"Delivery service with name {lane.name} exception: ")
+
+    async def call_async(self, services, method, *args):
+        """
+        Asynchronous variant of call, event loop isn't blocked while services work
+        """
+        await asyncio.gather(*(self._wait_async(lane, future, method)
+                               for lane, future, wait in self._submit(services, method, args) if wait))
+
+    def report(self):
+        return self._stats.report()
+
+    def shutdown(self, wait=True):
+        LOGGER.debug("Shutting down delivery dispatcher")
+        self._executor.shutdown(wait=wait)
@@ -1,13 +1,24 @@
+import ast
 import importlib
+import importlib.metadata
 import importlib.util
 import os
+import re
 import subprocess
 import sys
+from threading import Lock, RLock
 
 from .logger import get_logger
 
+try:
+    from packaging.requirements import Requirement, InvalidRequirement
+except ImportError:
+    Requirement = None
+
 LOGGER = get_logger("import_service")
 
+REQUIREMENT_NAME = re.compile(r"^\s*([A-Za-z0-9][A-Za-z0-9._-]*)\s*(\[[^\]]*\])?\s*((?:[<>=!~]=?|===)[^;]*)?(;.*)?$")
+
 
 def load_py_from(path, execute=True):
     name = os.path.basename(path).replace(".py", "")
@@ -18,10 +29,179 @@ def load_py_from(path, execute=True):
     return module
 
 
-def pip_install(requirements):
+class CodeCache:
+    """
+    Compiled code of python files keyed by real path. File is read and compiled
+    again only when its mtime is changed, every module gets own namespace
+    """
+
+    def __init__(self):
+        self._entries = {}  # real path -> (mtime, code)
+        self._lock = Lock()
+
+    def code(self, path):
+        path = os.path.realpath(path)
+        mtime = os.stat(path).st_mtime_ns
+        entry = self._entries.get(path)
+        if entry is not None and entry[0] == mtime:
+            return entry[1]
+        with self._lock:
+            LOGGER.debug(f"Compiling {path}")
+            with open(path, "rb") as fobj:
+                code = compile(importlib.util.decode_source(fobj.read()), path, "exec", dont_inherit=True)
+            self._entries[path] = (mtime, code)
+        return code
+
+    def load(self, path):
+        """
+        Executes cached code of file in new module, as load_py_from does
+        """
+        code = self.code(path)
+        name = os.path.basename(path).replace(".py", "")
+        module = importlib.util.module_from_spec(importlib.util.spec_from_file_location(name, path))
+        exec(code, module.__dict__)
+        return module
+
+    def forget(self, path):
+        with self._lock:
+            self._entries.pop(os.path.realpath(path), None)
+
+
+CODE_CACHE = CodeCache()
+
+
+class SubmoduleCache:
+    """
+    Executed submodules keyed by real path and mtime. Importing unchanged
+    file again returns the same module, changed file is executed again
+    """
+
+    def __init__(self, code_cache=CODE_CACHE):
+        self._code_cache = code_cache
+        self._modules = {}  # real path -> (mtime, module)
+        self._lock = RLock()  # submodule may import other submodules while executing
+
+    def load(self, path):
+        path = os.path.realpath(path)
+        mtime = os.stat(path).st_mtime_ns
+        entry = self._modules.get(path)
+        if entry is not None and entry[0] == mtime:
+            return entry[1]
+        with self._lock:
+            entry = self._modules.get(path)
+            if entry is None or entry[0] != mtime:
+                LOGGER.debug(f"Executing submodule {path}")
+                entry = mtime, self._code_cache.load(path)
+                self._modules[path] = entry
+        return entry[1]
+
+    def reload(self, path):
+        """
+        Executes submodule again even if its file wasn't changed
+        """
+        with self._lock:
+            self._modules.pop(os.path.realpath(path), None)
+            self._code_cache.forget(path)
+            return self.load(path)
+
+
+SUBMODULES = SubmoduleCache()
+
+
+def resolve_path(base, path):
+    """
+    Resolves path relatively to plugin directory without changing working directory
+    :param base: plugin directory or file of single-file plugin
+    """
+    if os.path.isfile(base):
+        base = os.path.dirname(base)
+    return os.path.normpath(os.path.join(base, path))
+
+
+def submodule_path(base, module_name):
+    # module name without py
+    return resolve_path(base, module_name.replace(".py", "") + ".py")
+
+
+SETTINGS_NAMES = ("SETTINGS", "CONFIGS", "MANIFEST")
+
+
+def read_settings(path):
+    """
+    Reads SETTINGS, CONFIGS or MANIFEST dict of plugin without executing its code
+    :return: copy of dict, None if settings aren't literal or file can't be parsed
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as fobj:
+            tree = ast.parse(fobj.read(), path)
+    except (OSError, SyntaxError, ValueError):
+        LOGGER.exception(f"Failed to read settings of {path}: ")
+        return None
+    found = {}
+    for node in tree.body:
+        if not isinstance(node, ast.Assign):
+            continue
+        for target in node.targets:
+            if isinstance(target, ast.Name) and target.id in SETTINGS_NAMES:
+                try:
+                    found[target.id] = ast.literal_eval(node.value)
+                except ValueError:
+                    return None
+    for name in SETTINGS_NAMES:
+        if found.get(name):
+            return dict(found[name]) if isinstance(found[name], dict) else None
+    return {}
+
+
+def requirement_installed(requirement):
+    """
+    Checks requirement against installed distributions without running pip.
+    Version specifiers and environment markers are checked if packaging is installed
+    :return: True or False, None if requirement can't be checked (URL, pip option)
+    """
+    if Requirement is not None:
+        try:
+            parsed = Requirement(requirement)
+        except InvalidRequirement:
+            return None
+        if parsed.url:
+            return None
+        if parsed.marker is not None and not parsed.marker.evaluate():
+            return True
+        name, specifier = parsed.name, parsed.specifier
+    else:
+        match = REQUIREMENT_NAME.match(requirement)
+        if match is None:
+            return None
+        name, specifier = match.group(1), None
+    try:
+        version = importlib.metadata.version(name)
+    except importlib.metadata.PackageNotFoundError:
+        return False
+    return specifier is None or specifier.contains(version, prereleases=True)
+
+
+def unique_requirements(requirements):
+    """
+    Drops empty lines, comments and duplicates, keeps order
+    """
+    result = []
+    for requirement in requirements:
+        requirement = requirement.split(" #")[0].strip()
+        if requirement and not requirement.startswith("#") and requirement not in result:
+            result.append(requirement)
+    return result
+
+
+def pip_install(requirements, wheelhouse=None):
+    """
+    Installs requirements in one pip invocation
+    :param wheelhouse: directory with wheels, if specified - pip doesn't use index
+    """
     print("Satisfacting requirement ({}). It may take a while...".format(" ".join(requirements)))
     LOGGER.info("Satisfacting requirement ({})...".format(" ".join(requirements)))
+    options = ["--no-index", "--find-links", wheelhouse] if wheelhouse else []
     return subprocess.run(
-        [sys.executable, '-m', 'pip', 'install', *requirements],
+        [sys.executable, '-m', 'pip', 'install', *options, *requirements],
         stdout=subprocess.PIPE, encoding='utf-8'
     )
@@ -1,4 +1,3 @@
-from .storage import lookup_services_path
 from .models import InputService
 import os
 from . import import_service
@@ -12,7 +11,7 @@ LOGGER = get_logger("input")
 def load_services(app):
     LOGGER.info("Loading input services")
     imported = {}
-    paths = lookup_services_path("input_services")
+    paths = app.manifest.lookup_services_path("input_services")
     for path in paths:
         name = os.path.basename(path).replace(".py", "")
         imported[name] = InputService(name, import_service.load_py_from(path), app, path)
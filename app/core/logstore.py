@@ -0,0 +1,317 @@
+import os
+import struct
+import zlib
+from threading import RLock, Thread
+from .appconfig import MAX_REQUEST_CACHE_SIZE
+from .logger import get_logger
+
+
+LOGGER = get_logger("logstore")
+
+# record: crc32 | key length | value length | key | value
+# crc32 covers everything after itself, value length TOMBSTONE marks removal
+HEADER = struct.Struct(">III")
+LENGTHS = struct.Struct(">II")
+TOMBSTONE = 0xFFFFFFFF
+SEGMENT_SUFFIX = ".seg"
+COMPACT_SUFFIX = ".compact"  # compacted segment being written
+COMPACTED_SUFFIX = ".compacted"  # compacted segment which was fsynced completely
+
+
+def encode_record(key: bytes, value):
+    """
+    Builds one log record. If value is None, builds a tombstone record
+    """
+    if value is None:
+        lengths = LENGTHS.pack(len(key), TOMBSTONE)
+        value = b""
+    else:
+        lengths = LENGTHS.pack(len(key), len(value))
+    crc = zlib.crc32(value, zlib.crc32(key, zlib.crc32(lengths)))
+    return struct.pack(">I", crc) + lengths + key + value
+
+
+def iter_records(data):
+    """
+    Iterates over valid records of segment data.
+    Yields tuples (key, value offset, value length, record end).
+    Stops at first truncated or corrupted record
+    """
+    offset = 0
+    while offset + HEADER.size <= len(data):
+        crc, klen, vlen = HEADER.unpack_from(data, offset)
+        body = klen if vlen == TOMBSTONE else klen + vlen
+        end = offset + HEADER.size + body
+        if end > len(data) or zlib.crc32(data[offset + 4:end]) != crc:
+            return
+        key = bytes(data[offset + HEADER.size:offset + HEADER.size + klen])
+        yield key, offset + HEADER.size + klen, vlen, end
+        offset = end
+
+
+class LogRequestStore:
+    """
+    Append-only request cache. Every put/remove appends one record to
+    the active segment, index keeps exact (segment, offset, length) of values.
+    Sealed segments are compacted in background thread
+    """
+
+    def __init__(self, path, max_segment_size=MAX_REQUEST_CACHE_SIZE,
+                 compact_threshold=4, sync=False):
+        self._path = path
+        self._max_segment_size = max_segment_size
+        self._compact_threshold = compact_threshold
+        self._sync = sync
+        self._index = {}
+        self._active = 0
+        self._active_size = 0
+        self._fobj = None
+        self._generation = 0
+        self._compactor = None
+        self._lock = RLock()
+        os.makedirs(path, exist_ok=True)
+        self.reload()
+
+    def _segment_path(self, number):
+        return os.path.join(self._path, f"{number:06d}{SEGMENT_SUFFIX}")
+
+    def _segments(self):
+        result = []
+        for name in os.listdir(self._path):
+            number = name[:-len(SEGMENT_SUFFIX)]
+            if name.endswith(SEGMENT_SUFFIX) and number.isdigit():
+                result.append(int(number))
+        return sorted(result)
+
+    def _close_active(self):
+        if self._fobj:
+            self._fobj.close()
+            self._fobj = None
+
+    def _active_file(self):
+        if self._fobj is None:
+            self._fobj = open(self._segment_path(self._active), "ab")
+        return self._fobj
+
+    def _recover_compaction(self):
+        """
+        Finishes compaction interrupted by crash. Compacted file gets its final
+        suffix only after it was fsynced, so only such file may replace segments.
+        File which is still being written is incomplete and removed
+        """
+        for name in os.listdir(self._path):
+            tmp = os.path.join(self._path, name)
+            if name.endswith(COMPACT_SUFFIX):
+                LOGGER.warning(f"Removing incomplete compacted segment: {name}")
+                os.remove(tmp)
+                continue
+            if not name.endswith(COMPACTED_SUFFIX):
+                continue
+            number = name[:-len(COMPACTED_SUFFIX)]
+            if not number.isdigit():
+                os.remove(tmp)
+                continue
+            LOGGER.info(f"Finishing interrupted compaction: {name}")
+            self._swap_compacted(int(number), tmp)
+
+    def _swap_compacted(self, target, compacted):
+        """
+        Replaces segments up to target with compacted segment
+        """
+        for segment in self._segments():
+            if segment < target:
+                os.remove(self._segment_path(segment))
+        os.replace(compacted, self._segment_path(target))
+
+    def _replay(self, number):
+        path = self._segment_path(number)
+        with open(path, "rb") as fobj:
+            data = fobj.read()
+        end = 0
+        for key, offset, length, end in iter_records(data):
+            key = key.decode("utf-8")
+            if length == TOMBSTONE:
+                self._index.pop(key, None)
+            else:
+                self._index[key] = (number, offset, length)
+        if end != len(data):
+            LOGGER.warning(f"Truncating partial record in request log {number} at {end}")
+            with open(path, "r+b") as fobj:
+                fobj.truncate(end)
+        return end
+
+    def reload(self):
+        """
+        Rebuilds index by replaying segments, truncates partially written tails
+        """
+        with self._lock:
+            self._close_active()
+            self._recover_compaction()
+            self._index.clear()
+            self._active_size = 0
+            segments = self._segments()
+            for number in segments:
+                self._active_size = self._replay(number)
+            self._active = segments[-1] if segments else 0
+            LOGGER.debug(f"Request log index built: {len(self._index)} entries, {len(segments)} segments")
+
+    def __contains__(self, request):
+        return request in self._index
+
+    def __len__(self):
+        return len(self._index)
+
+    def find(self, request):
+        entry = self._index.get(request)
+        if entry is not None:
+            return entry[0]
+
+    def path(self, request):
+        entry = self._index.get(request)
+        if entry is not None:
+            return self._segment_path(entry[0])
+
+    def describe(self):
+        """
+        Yields (request, size in bytes, creation time) for every indexed request
+        """
+        with self._lock:
+            created = {number: os.path.getmtime(self._segment_path(number))
+                       for number in self._segments()}
+            for request, (number, _, length) in list(self._index.items()):
+                yield request, len(request.encode("utf-8")) + length, created.get(number, 0)
+
+    def _read_value(self, number, offset, length):
+        with open(self._segment_path(number), "rb") as fobj:
+            fobj.seek(offset)
+            return fobj.read(length)
+
+    def lookup(self, request):
+        """
+        Returns tuple (hit, value). Reads exactly the value bytes
+        """
+        with self._lock:
+            entry = self._index.get(request)
+            if entry is None:
+                return False, None
+            if entry[0] == self._active and self._fobj:
+                self._fobj.flush()
+            data = self._read_value(*entry)
+        return True, data.decode("utf-8")
+
+    def _append(self, key, value):
+        record = encode_record(key, value)
+        if self._active_size > 0 and self._active_size + len(record) > self._max_segment_size:
+            self._rotate()
+        fobj = self._active_file()
+        offset = self._active_size
+        fobj.write(record)
+        fobj.flush()
+        if self._sync:
+            os.fsync(fobj.fileno())
+        self._active_size += len(record)
+        return self._active, offset + HEADER.size + len(key)
+
+    def _rotate(self):
+        self._close_active()
+        self._active += 1
+        self._active_size = 0
+        LOGGER.debug(f"Filling new request log segment: {self._active}")
+        if len(self._segments()) >= self._compact_threshold:
+            self.compact_background()
+
+    def put(self, request, data):
+        value = data.encode("utf-8")
+        with self._lock:
+            number, offset = self._append(request.encode("utf-8"), value)
+            self._index[request] = (number, offset, len(value))
+
+    def remove(self, request):
+        with self._lock:
+            if request not in self._index:
+                return False
+            self._append(request.encode("utf-8"), None)
+            self._index.pop(request)
+        LOGGER.debug(f"Removing {request}")
+        return True
+
+    def close(self):
+        with self._lock:
+            # compaction which is running now mustn't swap data of closed store
+            self._generation += 1
+            self._close_active()
+
+    def clear(self):
+        with self._lock:
+            self._close_active()
+            self._generation += 1
+            for number in self._segments():
+                os.remove(self._segment_path(number))
+            self._index.clear()
+            self._active = 0
+            self._active_size = 0
+
+    def compact_background(self):
+        if self._compactor is not None and self._compactor.is_alive():
+            return
+        self._compactor = Thread(target=self.compact, daemon=True)
+        self._compactor.start()
+
+    def compact(self):
+        """
+        Rewrites live records of all sealed segments into the newest sealed one.
+        Writes happen outside the lock, only the swap blocks readers
+        """
+        with self._lock:
+            sealed = [number for number in self._segments() if number < self._active]
+            if not sealed:
+                return
+            target = sealed[-1]
+            generation = self._generation
+            live = {key: entry for key, entry in self._index.items() if entry[0] <= target}
+        tmp = os.path.join(self._path, f"{target:06d}{COMPACT_SUFFIX}")
+        compacted = os.path.join(self._path, f"{target:06d}{COMPACTED_SUFFIX}")
+        moved = {}
+        try:
+            with open(tmp, "wb") as out:
+                offset = 0
+                for request, entry in live.items():
+                    key = request.encode("utf-8")
+                    record = encode_record(key, self._read_value(*entry))
+                    out.write(record)
+                    moved[request] = (target, offset + HEADER.size + len(key), entry[2])
+                    offset += len(record)
+                out.flush()
+                os.fsync(out.fileno())
+            # commit: only completely written file gets final suffix
+            os.replace(tmp, compacted)
+            self._sync_directory()
+        except OSError:
+            LOGGER.exception("Request log compaction failed: ")
+            self._remove_quietly(tmp)
+            return
+        with self._lock:
+            if generation != self._generation:
+                self._remove_quietly(compacted)
+                return
+            self._swap_compacted(target, compacted)
+            for request, location in moved.items():
+                if self._index.get(request) == live[request]:
+                    self._index[request] = location
+        LOGGER.info(f"Compacted {len(sealed)} request log segments into {target}: {len(moved)} records")
+
+    def _sync_directory(self):
+        if not hasattr(os, "O_DIRECTORY"):
+            return
+        fd = os.open(self._path, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    @staticmethod
+    def _remove_quietly(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
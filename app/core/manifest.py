@@ -0,0 +1,201 @@
+import os
+import json
+import hashlib
+from .appconfig import APP_PATH, DATA_PATH, DEFAULT_ENCODING
+from .import_service import read_settings, unique_requirements
+from .logger import get_logger
+from . import storage
+
+
+LOGGER = get_logger("manifest")
+
+MANIFEST_VERSION = 1
+MANIFEST_FILE = os.path.join(DATA_PATH, "cache", "manifest.json")
+MARKERS_FILE = os.path.join(DATA_PATH, "markers.json")
+
+
+def signature(path):
+    """
+    :return: [mtime, size] of file or directory, None if it doesn't exist
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def file_hash(path):
+    try:
+        with open(path, "rb") as fobj:
+            return hashlib.sha1(fobj.read()).hexdigest()
+    except OSError:
+        return None
+
+
+def child_directories(path):
+    if not os.path.isdir(path):
+        return []
+    return sorted(name for name in os.listdir(path) if os.path.isdir(os.path.join(path, name)))
+
+
+class StartupManifest:
+    """
+    Cache of startup discovery: plugin and service lookups, requirements,
+    literal settings of plugins and requirements which were already satisfied.
+    Lookups are valid while mtimes of scanned directories are the same,
+    files are checked by mtime and size, then by hash of content
+    """
+
+    def __init__(self, path=MANIFEST_FILE, data=None, enabled=True):
+        """
+        :param enabled: if False, every call goes to storage as without manifest
+        """
+        self._path = path
+        self._enabled = enabled
+        self._data = data or {"version": MANIFEST_VERSION, "lookups": {}, "files": {},
+                              "satisfied": [], "markers": None}
+        self._dirty = data is None
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def open(cls, path=MANIFEST_FILE):
+        data = None
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding=DEFAULT_ENCODING) as fobj:
+                    data = json.load(fobj)
+            except (OSError, ValueError):
+                LOGGER.warning("Startup manifest is broken, rebuilding it")
+            if data is not None and data.get("version") != MANIFEST_VERSION:
+                data = None
+        return cls(path, data)
+
+    def _lookup(self, kind, directories, function, files=()):
+        """
+        Returns cached lookup result while scanned directories are unchanged
+        :param directories: directories which content defines result
+        :param files: files which define result too
+        """
+        if not self._enabled:
+            return function()
+        key = [[path, signature(path)] for path in list(directories) + list(files)]
+        entry = self._data["lookups"].get(kind)
+        if entry is not None and entry["key"] == key \
+                and all(signature(path) == sig for path, sig in entry["children"]):
+            self.hits += 1
+            return entry["value"]
+        self.misses += 1
+        value = function()
+        # plugin directory mtime changes when its __init__.py appears or disappears
+        children = [os.path.join(path, name) for path in directories for name in child_directories(path)]
+        self._data["lookups"][kind] = {
+            "key": key,
+            "children": [[path, signature(path)] for path in children],
+            "value": value
+        }
+        self._dirty = True
+        return value
+
+    def lookup_plugins(self, plugin_type):
+        directories = [os.path.join(APP_PATH, plugin_type), os.path.join(DATA_PATH, plugin_type)]
+        return self._lookup(plugin_type, directories, lambda: storage.lookup_plugins(plugin_type))
+
+    def lookup_services_path(self, service_name):
+        directories = [os.path.join(APP_PATH, service_name), os.path.join(DATA_PATH, service_name)]
+        includes = [os.path.join(path, "include.txt") for path in directories]
+        return self._lookup(service_name, directories,
+                            lambda: storage.lookup_services_path(service_name), includes)
+
+    def _file(self, kind, path, loader):
+        """
+        Returns cached loader(path) while file is unchanged
+        """
+        if not self._enabled:
+            return loader(path)
+        key = f"{kind}:{path}"
+        entry = self._data["files"].get(key)
+        sig = signature(path)
+        if entry is not None:
+            if entry["signature"] == sig:
+                self.hits += 1
+                return entry["value"]
+            digest = file_hash(path)
+            if digest is not None and digest == entry["hash"]:
+                self.hits += 1
+                entry["signature"] = sig
+                self._dirty = True
+                return entry["value"]
+        self.misses += 1
+        value = loader(path)
+        self._data["files"][key] = {"signature": sig, "hash": file_hash(path), "value": value}
+        self._dirty = True
+        return value
+
+    def requirements(self, path):
+        return self._file("requirements", path, storage.get_requirements)
+
+    def settings(self, path):
+        """
+        Literal settings of plugin, see import_service.read_settings
+        """
+        return self._file("settings", path, read_settings)
+
+    def satisfied(self, requirements):
+        """
+        Checks that requirements were satisfied before and markers.json wasn't changed since
+        """
+        if not self._enabled:
+            return False
+        requirements = unique_requirements(requirements)
+        if not requirements:
+            return True
+        if self._data["markers"] != signature(MARKERS_FILE):
+            self._data["satisfied"] = []
+            self._data["markers"] = None
+            self._dirty = True
+            return False
+        satisfied = self._data["satisfied"]
+        return all(requirement in satisfied for requirement in requirements)
+
+    def mark_satisfied(self, requirements):
+        satisfied = self._data["satisfied"]
+        for requirement in unique_requirements(requirements):
+            if requirement not in satisfied:
+                satisfied.append(requirement)
+        self._data["markers"] = signature(MARKERS_FILE)
+        self._dirty = True
+
+    def plugin_requirements(self):
+        """
+        :return: requirements of all extensions and modules
+        """
+        requirements = []
+        for plugin_type in ("extensions", "modules"):
+            for path in self.lookup_plugins(plugin_type).values():
+                requirements.extend(self.requirements(os.path.join(path, "requirements.txt")))
+        return requirements
+
+    def satisfy(self, requirements):
+        """
+        Satisfies requirements unless they were satisfied before.
+        Requirements are compared without comments and duplicates
+        """
+        requirements = unique_requirements(requirements)
+        if self.satisfied(requirements):
+            return
+        self.mark_satisfied(storage.satisfact_requirements(requirements))
+
+    def save(self):
+        if not self._enabled or not self._dirty:
+            return
+        LOGGER.debug(f"Saving startup manifest: {self._path}")
+        tmp = self._path + ".tmp"
+        try:
+            with open(tmp, "w", encoding=DEFAULT_ENCODING) as fobj:
+                json.dump(self._data, fobj, ensure_ascii=False)
+            os.replace(tmp, self._path)
+            self._dirty = False
+        except OSError:
+            LOGGER.exception("Failed to save startup manifest: ")
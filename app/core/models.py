@@ -4,6 +4,12 @@ import os
 from .logger import get_logger
 from .appconfig import DEFAULT_MODULE_CONFIG
 from . import include
+from .utils import run_coroutine
+import asyncio
+import functools
+import inspect
+from types import MappingProxyType
+from threading import RLock
 
 
 LOGGER = get_logger("objects")
@@ -14,8 +20,8 @@ def put_if_not_present(dct, key, value):
         dct[key] = value
 
 
-def _add_default_settings(object, result):
-    put_if_not_present(result, "NAME", object.name)
+def _add_default_settings(name, result):
+    put_if_not_present(result, "NAME", name)
     put_if_not_present(result, "VERSION", "1.0")
     put_if_not_present(result, "BUILD", 10)
     put_if_not_present(result, "DEPENDENCIES", [])
@@ -24,6 +30,54 @@ def _add_default_settings(object, result):
     put_if_not_present(result, "TARGET_API_VERSION", appinfo.API_VERSION)
 
 
+def _native_settings(module):
+    """
+    Returns copy of SETTINGS, CONFIGS or MANIFEST dict of native module
+    """
+    result = _module_attr(module, "SETTINGS") \
+        or _module_attr(module, "CONFIGS") \
+        or _module_attr(module, "MANIFEST")
+    return dict(result) if result else {}
+
+
+class CachedConfigs:
+    """
+    Memoized read-only view of plugin configs. View is rebuilt only
+    after invalidate_configs, then on_configs_changed hooks are called
+    """
+    _configs_view = None
+    _configs_hooks = None
+
+    @property
+    def configs(self):
+        view = self._configs_view
+        if view is None:
+            view = self._configs_view = MappingProxyType(self._build_configs())
+        return view
+
+    def _build_configs(self):
+        result = _native_settings(self._native_module)
+        _add_default_settings(self.name, result)
+        return result
+
+    def invalidate_configs(self):
+        """
+        Must be called when plugin changes its settings
+        """
+        self._configs_view = None
+        for hook in self._configs_hooks or ():
+            hook(self)
+
+    def on_configs_changed(self, hook):
+        """
+        :param hook: function called with plugin object after its configs were invalidated
+        """
+        if self._configs_hooks is None:
+            self._configs_hooks = []
+        if hook not in self._configs_hooks:
+            self._configs_hooks.append(hook)
+
+
 def _module_attr(module, attr):
     LOGGER.debug(f"Module attribute getting with name {attr}")
     try:
@@ -52,7 +106,35 @@ def _module_call(module, attr, *args, **kwargs):
         return None
 
 
-class Module:
+def _module_call_sync(module, attr, *args, **kwargs):
+    """
+    Calls module function, coroutine functions are run to completion
+    """
+    result = _module_call(module, attr, *args, **kwargs)
+    if asyncio.iscoroutine(result):
+        try:
+            result = run_coroutine(result)
+        except Exception:
+            LOGGER.exception("Unknown attribute getting error: ")
+            return None
+    return result
+
+
+async def _module_call_async(module, attr, *args, **kwargs):
+    """
+    Calls module function, coroutine functions are awaited
+    """
+    result = _module_call(module, attr, *args, **kwargs)
+    if asyncio.iscoroutine(result):
+        try:
+            result = await result
+        except Exception:
+            LOGGER.exception("Unknown attribute getting error: ")
+            return None
+    return result
+
+
+class Module(CachedConfigs):
     def __init__(self, name, native_module, path,
                  app):
         LOGGER.debug("Creating new module object %s in path: %s" % (name, path))
@@ -93,11 +175,26 @@ class Module:
 
     def swallow(self, value):
         LOGGER.debug(f"{self._name} swallows: {value}")
-        return _module_call(self._native_module, "swallow", value)
+        return _module_call_sync(self._native_module, "swallow", value)
 
     def interrupt_call(self, value):
         LOGGER.debug(f"{self._name} interrupts by: {value}")
-        return _module_call(self._native_module, "interrupt_call", value)
+        return _module_call_sync(self._native_module, "interrupt_call", value)
+
+    async def swallow_async(self, value):
+        """
+        Awaits swallow if module defines it as coroutine, else calls it in place
+        """
+        LOGGER.debug(f"{self._name} swallows: {value}")
+        if self._native_module is None:
+            return self.swallow(value)
+        return await _module_call_async(self._native_module, "swallow", value)
+
+    async def interrupt_call_async(self, value):
+        LOGGER.debug(f"{self._name} interrupts by: {value}")
+        if self._native_module is None:
+            return self.interrupt_call(value)
+        return await _module_call_async(self._native_module, "interrupt_call", value)
 
     def init(self):
         LOGGER.debug(f"{self._name} is initializing")
@@ -117,22 +214,25 @@ class Module:
                 dct[key] = defaults[key]
         return dct
 
-    @property
-    def configs(self):
-        result = _module_attr(self._native_module, "SETTINGS") \
-            or _module_attr(self._native_module, "CONFIGS") \
-            or _module_attr(self._native_module, "MANIFEST")
-        if result is None:
-            result = {}
+    @staticmethod
+    def complete_configs(name, settings):
+        """
+        Adds default module configs to settings of module
+        """
+        result = dict(settings)
         put_if_not_present(result, "NOCACHE", True)
+        put_if_not_present(result, "CACHE_TTL", None)
         put_if_not_present(result, "ENTER_CONTEXT", False)
         put_if_not_present(result, "QUIT_COMMANDS", ["quit", "exit", "exit()", "quit()"])
 
-        _add_default_settings(self, result)
+        _add_default_settings(name, result)
         return result
 
+    def _build_configs(self):
+        return self.complete_configs(self._name, _native_settings(self._native_module))
 
-class DeliveryService:
+
+class DeliveryService(CachedConfigs):
     def __init__(self, name, native_module, path, app):
         LOGGER.debug(f"Creating delivery service with name {name}")
         self._name = name
@@ -145,16 +245,6 @@ class DeliveryService:
                 _set_in_module(self._native_module, attr, include.SERVICES[attr])
         self.init()
 
-    @property
-    def configs(self):
-        result = _module_attr(self._native_module, "SETTINGS") \
-                 or _module_attr(self._native_module, "CONFIGS") \
-                 or _module_attr(self._native_module, "MANIFEST")
-        if result is None:
-            result = {}
-        _add_default_settings(self, result)
-        return result
-
     @property
     def path(self):
         return self._path
@@ -174,26 +264,85 @@ class DeliveryService:
         _module_call(self._native_module, "help", *args)
 
     def begin(self):
-        _module_call(self._native_module, "begin")
+        _module_call_sync(self._native_module, "begin")
 
     def finished(self, count):
-        _module_call(self._native_module, "finished", count)
+        _module_call_sync(self._native_module, "finished", count)
 
     def send(self, packet):
         try:
             if hasattr(self._native_module, "send"):
-                self._native_module.__getattribute__("send")(packet)
+                result = self._native_module.__getattribute__("send")(packet)
+                if asyncio.iscoroutine(result):
+                    run_coroutine(result)
             else:
                 LOGGER.error(f"Failed to send packet: send method wasn't found. Name: {self._name}")
         except Exception:
             LOGGER.exception(f"Delivery service with name {self._name} exception: ")
 
+    @property
+    def batching(self):
+        """
+        True if service defines send_batch hook
+        """
+        return hasattr(self._native_module, "send_batch")
+
+    def send_batch(self, packets):
+        """
+        Sends list of packets in one send_batch call, services without hook get packets one by one
+        """
+        if not self.batching:
+            for packet in packets:
+                self.send(packet)
+            return
+        try:
+            result = self._native_module.__getattribute__("send_batch")(list(packets))
+            if asyncio.iscoroutine(result):
+                run_coroutine(result)
+        except Exception:
+            LOGGER.exception(f"Delivery service with name {self._name} exception: ")
+
+    async def begin_async(self):
+        await _module_call_async(self._native_module, "begin")
+
+    async def finished_async(self, count):
+        await _module_call_async(self._native_module, "finished", count)
+
+    async def send_async(self, packet):
+        """
+        Awaits send if service defines it as coroutine, else calls it in place
+        """
+        try:
+            if hasattr(self._native_module, "send"):
+                result = self._native_module.__getattribute__("send")(packet)
+                if asyncio.iscoroutine(result):
+                    await result
+            else:
+                LOGGER.error(f"Failed to send packet: send method wasn't found. Name: {self._name}")
+        except Exception:
+            LOGGER.exception(f"Delivery service with name {self._name} exception: ")
+
+    async def send_batch_async(self, packets):
+        """
+        Asynchronous variant of send_batch
+        """
+        if not self.batching:
+            for packet in packets:
+                await self.send_async(packet)
+            return
+        try:
+            result = self._native_module.__getattribute__("send_batch")(list(packets))
+            if asyncio.iscoroutine(result):
+                await result
+        except Exception:
+            LOGGER.exception(f"Delivery service with name {self._name} exception: ")
+
     @property
     def native_module(self):
         return self._native_module
 
 
-class InputService:
+class InputService(CachedConfigs):
     def __init__(self, name, native_module, app, path):
         LOGGER.debug(f"Creating input service with name {name}")
         self._name = name
@@ -219,16 +368,6 @@ class InputService:
     def native_module(self):
         return self._native_module
 
-    @property
-    def configs(self):
-        result = _module_attr(self._native_module, "SETTINGS") \
-                 or _module_attr(self._native_module, "CONFIGS") \
-                 or _module_attr(self._native_module, "MANIFEST")
-        if result is None:
-            result = {}
-        _add_default_settings(self, result)
-        return result
-
     def help(self, *args):
         LOGGER.debug(f"Returning help message")
         _module_call(self._native_module, "help", *args)
@@ -252,40 +391,93 @@ class ExtensionInfo:
         self._name = name
         self._path = path
         self._app = app
+        self._loaded = None  # (mtime, extension without paired module, is singleton)
+        self._singleton = None
+        self._lock = RLock()
 
     def __repr__(self):
         return f"ExtensionInfo <name={self._name};path={self._path}>"
 
-    def build(self, module):
+    def manifest(self):
+        """
+        Configs of extension read without importing it
+        :return: dict, None if extension doesn't define its settings literally
+        """
+        settings = self._app.manifest.settings(os.path.join(self._path, "__init__.py"))
+        if settings is None:
+            return None
+        _add_default_settings(self._name, settings)
+        return settings
+
+    def _load(self):
+        """
+        Executes extension module once, again only after its file was changed
+        :return: tuple (extension without paired module, is singleton)
+        """
         path = os.path.join(self._path, "__init__.py")
-        native_module = import_service.load_py_from(path)
-        extension = Extension(self._name, module, native_module, self._path,
-                              self._app)
-        if not self._app.config.relative_cfg("isolated_module", extension):
+        mtime = os.stat(path).st_mtime_ns
+        loaded = self._loaded
+        if loaded is not None and loaded[0] == mtime:
+            return loaded[1:]
+        with self._lock:
+            if self._loaded is None or self._loaded[0] != mtime:
+                LOGGER.debug(f"Executing extension {self._name}")
+                native_module = import_service.CODE_CACHE.load(path)
+                binding = ctx.ExtensionContextBinding(self._name)
+                if hasattr(native_module, "put_ctx"):
+                    native_module.put_ctx(binding)
+                else:
+                    native_module.ctx = binding
+                for attr in include.EXTENSIONS:
+                    _set_in_module(native_module, attr, include.EXTENSIONS[attr])
+                shared = Extension(self._name, None, native_module, binding, self._path, self._app)
+                binding.default = shared.context
+                self._loaded = mtime, shared, bool(_native_settings(native_module).get("SINGLETON"))
+            return self._loaded[1:]
+
+    def build(self, module):
+        """
+        Binds extension module, executed once, to context of module. Extension with
+        SINGLETON setting is not bound, one instance is shared by all consumers
+        """
+        if self._singleton is not None:
+            return self._singleton
+        with self._lock:
+            if self._singleton is not None:
+                return self._singleton
+            shared, singleton = self._load()
+            if singleton or module is None:
+                extension = shared
+            else:
+                extension = Extension(self._name, module, shared.native_module, shared.binding, self._path,
+                                      self._app)
+            if self._app.config.relative_cfg("isolated_module", extension):
+                raise PermissionError("Specified extension is isolated")
+            if singleton:
+                LOGGER.debug(f"Extension {self._name} is singleton")
+                self._singleton = extension
             return extension
-        else:
-            raise PermissionError("Specified extension is isolated")
+
+    def shared(self):
+        """
+        Extension without paired module, e.g. for reading configs
+        """
+        return self.build(None)
 
 
-class Extension:
+class Extension(CachedConfigs):
     def __init__(self, name, module_src,
-                 native_module, path, app):
+                 native_module, binding, path, app):
         if module_src:
             LOGGER.debug(f"Creating extension with name {name} for {module_src.name}")
         else:
             LOGGER.debug(f"Creating extension with name {name} without paired module")
         self._name = name
         self._native_module = native_module
+        self._binding = binding
         self._path = path
         self._app = app
         self._ctx = ctx.ExtensionContext(self, module_src, app)
-        if self._native_module:
-            if hasattr(self._native_module, "put_ctx"):
-                self.put_ctx(self._ctx)
-            else:
-                self._native_module.ctx = self._ctx
-            for attr in include.EXTENSIONS:
-                _set_in_module(self._native_module, attr, include.EXTENSIONS[attr])
 
     @property
     def native_module(self):
@@ -299,6 +491,10 @@ class Extension:
     def context(self):
         return self._ctx
 
+    @property
+    def binding(self):
+        return self._binding
+
     @property
     def path(self):
         return self._path
@@ -306,18 +502,32 @@ class Extension:
     def __repr__(self):
         return f"Extension <name={self.name};path={self.path}>"
 
-    @property
-    def configs(self):
-        result = _module_attr(self._native_module, "SETTINGS") \
-                 or _module_attr(self._native_module, "CONFIGS") \
-                 or _module_attr(self._native_module, "MANIFEST")
-        if result is None:
-            result = {}
-        _add_default_settings(self, result)
-        return result
+    def _bound(self, function):
+        """
+        Wraps function of extension module, so its ctx is context of this extension while called
+        """
+        binding, context = self._binding, self._ctx
+        if asyncio.iscoroutinefunction(function):
+            async def call(*args, **kwargs):
+                token = binding.bind(context)
+                try:
+                    return await function(*args, **kwargs)
+                finally:
+                    binding.unbind(token)
+        else:
+            def call(*args, **kwargs):
+                token = binding.bind(context)
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    binding.unbind(token)
+        return functools.wraps(function)(call)
 
     def __getattr__(self, attr):
         if attr in dir(super().__getattribute__("_native_module")):
-            return super().__getattribute__("_native_module").__getattribute__(attr)
+            value = super().__getattribute__("_native_module").__getattribute__(attr)
+            if inspect.isfunction(value):
+                return self._bound(value)
+            return value
         else:
             LOGGER.warning(f"Extension attribute '{attr}' wasn't found")
@@ -1,32 +1,132 @@
-from .storage import lookup_modules, \
-    get_requirements, satisfact_requirements
 from . import import_service
+from .appconfig import LAZY_PLUGINS
 from .models import Module
 from .logger import get_logger
+from threading import RLock, Thread
 import os
 
 
 LOGGER = get_logger("module_loader")
 
 
+class ModuleTable(dict):
+    """
+    Modules dict which imports and initializes registered modules on first access.
+    Until then module is known only by its manifest (literal SETTINGS of module),
+    so checking names, iterating and peeking configs don't import anything
+    """
+
+    def __init__(self, app):
+        super().__init__()
+        self._app = app
+        self._pending = {}  # name -> module directory
+        self._manifests = {}  # name -> configs of not imported module
+        self._lock = RLock()
+
+    def register(self, name, path, settings):
+        """
+        Registers module without importing it
+        :param settings: literal settings of module
+        """
+        self._pending[name] = path
+        self._manifests[name] = Module.complete_configs(name, settings)
+        super().__setitem__(name, None)
+
+    def loaded(self, name):
+        return name in self and name not in self._pending
+
+    def materialize(self, name):
+        with self._lock:
+            if name in self._pending:
+                LOGGER.info(f"Importing lazy module {name}")
+                module = import_module(name, self._pending[name], self._app)
+                module.on_configs_changed(self._app.config.reload_plugin)
+                super().__setitem__(name, module)
+                del self._pending[name]
+                del self._manifests[name]
+        return super().__getitem__(name)
+
+    def peek(self, name):
+        """
+        :return: configs of module, manifest configs if module isn't imported yet
+        """
+        manifest = self._manifests.get(name)
+        if manifest is not None:
+            return manifest
+        return self[name].configs
+
+    def __getitem__(self, name):
+        if name in self._pending:
+            return self.materialize(name)
+        return super().__getitem__(name)
+
+    def __setitem__(self, name, module):
+        with self._lock:
+            self._pending.pop(name, None)
+            self._manifests.pop(name, None)
+            super().__setitem__(name, module)
+
+    def __delitem__(self, name):
+        with self._lock:
+            self._pending.pop(name, None)
+            self._manifests.pop(name, None)
+            super().__delitem__(name)
+
+    def get(self, name, default=None):
+        return self[name] if name in self else default
+
+    def values(self):
+        return [self[name] for name in self]
+
+    def items(self):
+        return [(name, self[name]) for name in self]
+
+    def warmup(self, names):
+        """
+        Imports modules in background thread
+        :return: started thread
+        """
+        def run():
+            for name in names:
+                if name not in self:
+                    LOGGER.warning(f"Module {name} from warm-up list wasn't found")
+                    continue
+                try:
+                    self.materialize(name)
+                except Exception:
+                    LOGGER.exception(f"Module {name} warm-up failed: ")
+
+        thread = Thread(target=run, name="module-warmup", daemon=True)
+        thread.start()
+        return thread
+
+
+def import_module(name, path, app):
+    return Module(
+        name,
+        import_service.load_py_from(os.path.join(path, "__init__.py")),
+        path,
+        app
+    )
+
+
 def load_modules(app):
-    imported = {}
-    modules = lookup_modules()
+    imported = ModuleTable(app) if LAZY_PLUGINS else {}
+    manifest = app.manifest
+    modules = manifest.lookup_plugins("modules")
     LOGGER.info("Loading modules")
     for name in modules:
         path = os.path.join(modules[name], "__init__.py")
-        req = os.path.join(modules[name], "requirements.txt")
-        reqs = get_requirements(req)
-        satisfact_requirements(reqs)
-        module = Module(
-            name,
-            import_service.load_py_from(path),
-            modules[name],
-            app
-        )
-        for dep in module.configs["DEPENDENCIES"]:
+        settings = manifest.settings(path) if LAZY_PLUGINS else None
+        if settings is not None:
+            imported.register(name, modules[name], settings)
+            configs = imported.peek(name)
+        else:
+            module = import_module(name, modules[name], app)
+            configs = module.configs
+            imported[name] = module
+        for dep in configs["DEPENDENCIES"]:
             if dep not in app.extensions:
-                LOGGER.error(f"Missing {dep} in extensions. Module {module.name} wasn't loaded")
+                LOGGER.error(f"Missing {dep} in extensions. Module {name} wasn't loaded")
                 continue
-        imported[name] = module
     return imported
@@ -1,23 +1,39 @@
 import time
+import asyncio
+import codecs
+import re
+from collections.abc import Iterator
+from itertools import chain, islice
 from . import appconfig
 from .logger import get_logger
 
 
 LOGGER = get_logger("pipeline")
 
+WORD = re.compile(r"\s*\S+\s*")
+SENTENCE = re.compile(r"\s*[^.!?…|\n]*[.!?…|\n]*\s*")
+
 
 def delay(ms):
     LOGGER.debug(f"Delaying in {ms}")
     time.sleep(int(ms) / 1000)
 
 
+def is_stream(obj):
+    """
+    Checks that object is lazy source of packets (generator or another iterator)
+    """
+    return isinstance(obj, Iterator)
+
+
 class Pipeline:
     # In iterations may return $:USER_ACTION
 
     def __init__(self, cfg, **kwargs):
         LOGGER.debug("Creating pipeline object")
         self._cfg = cfg
-        self.DEFAULTS = self._cfg.absolute_cfg("PIPELINE")
+        # reloaded config.txt reaches pipeline through subscription
+        self.DEFAULTS = self._cfg.subscribe("PIPELINE", self._defaults_changed)
         for key in kwargs:
             assert key in self.DEFAULTS
         self._config = dict(kwargs or self.DEFAULTS)
@@ -28,7 +44,21 @@ class Pipeline:
         self._c = 0
         self._maxc = 0
         self._packets = None
+        self._lookahead = []
         self._limit_marker = False
+        self._timer = None
+
+    def _defaults_changed(self, defaults):
+        """
+        Applies new PIPELINE configs, values changed by config() are kept
+        """
+        if defaults is None:
+            return
+        LOGGER.info("Pipeline configs were changed")
+        previous, self.DEFAULTS = self.DEFAULTS, defaults
+        for key in defaults:
+            if key not in self._config or self._config[key] == previous.get(key):
+                self._config[key] = defaults[key]
 
     def config(self, **kwargs):
         LOGGER.info(f"Reconfiguring pipeline: {kwargs}")
@@ -40,10 +70,29 @@ class Pipeline:
     def configuration(self):
         return self._config
 
+    def spawn(self):
+        """
+        Creates empty pipeline with the same configuration
+        """
+        return Pipeline(self._cfg, **self._config)
+
+    def bind_timer(self, timer):
+        """
+        Binds timer which object waits packet delays instead of sleeping
+        """
+        self._timer = timer
+
+    def _delay(self, ms):
+        if self._timer is not None:
+            self._timer.wait(ms)
+        else:
+            delay(ms)
+
     def reset(self):
         LOGGER.info("Reset pipeline")
         self._source = None
         self._packets = None
+        self._lookahead = []
         self._c = 0
         self._maxc = 0
         if appconfig.RESET_PIPECONFIG:
@@ -71,7 +120,7 @@ class Pipeline:
         if self.is_filled():
             return False
         else:
-            return self._c < self._maxc
+            return not self._exhausted()
 
     def is_filled(self):
         return self._source is None or self._packets is None
@@ -79,66 +128,134 @@ class Pipeline:
     def put(self, data):
         LOGGER.info("Added new data to pipeline")
         if self._config["clear_text"]:
-            data = self.text_filter(data)
+            if is_stream(data):
+                data = (self.text_filter(item) if isinstance(item, str) else item for item in data)
+            else:
+                data = self.text_filter(data)
         self._source = data
 
     def preprocess(self):
+        """
+        Lazily splits source into packets
+        """
         if isinstance(self._source, str):
-            return list(self.pregenerate(self._source))
+            return self.pregenerate(self._source)
         else:
-            generated = []
-            for item in self._source:
-                if isinstance(item, str):
-                    generated += list(self.pregenerate(item))
-            return generated
+            return chain.from_iterable(
+                self.pregenerate(item) for item in self._source if isinstance(item, str)
+            )
 
     def pregenerate_symbol(self, source):
         LOGGER.info("Inititalizing symbol pregenerator engine")
-        partscount = len(source) // self._config["max_packet_length"]
-        partsmod = len(source) % self._config["max_packet_length"]
-        begin, end = 0, 0
-        i = 0
-        for i in range(partscount):
-            partnumber = f"{str(i + 1)}." if self._config["allow_part_number"] else ""
-            end += self._config["max_packet_length"] - len(partnumber)
-            partsmod += len(partnumber)  # fixme. it may cause bugs with huge packets count
+        begin = 0
+        i = 1
+        while begin < len(source):
+            partnumber = f"{str(i)}." if self._config["allow_part_number"] else ""
+            end = begin + max(self._config["max_packet_length"] - len(partnumber), 1)
+            i += 1
             yield partnumber + source[begin:end]
             begin = end
-        if partscount != 0:
-            i += 1
-        if partsmod != 0:
-            partnumber = f"{str(i + 1)}." if self._config["allow_part_number"] else ""
-            if partsmod + len(partnumber) <= self._config["max_packet_length"]:
-                yield partnumber + source[end:end + partsmod]
+
+    def pregenerate_words(self, source, sentences=False):
+        """
+        Packs whole words (or whole sentences if sentences is True) greedily
+        into packets. Longer sentences are packed by words, longer words are cut
+        """
+        LOGGER.info("Inititalizing words pregenerator engine")
+        limit = self._config["max_packet_length"]
+        numbered = self._config["allow_part_number"]
+        packet = []
+        length = 0
+        number = 1
+
+        def room():
+            return max(limit - len(f"{number}.") if numbered else limit, 1)
+
+        def flush():
+            nonlocal packet, length, number
+            text = "".join(packet).rstrip()
+            packet, length = [], 0
+            if text:
+                partnumber = f"{number}." if numbered else ""
+                number += 1
+                yield partnumber + text
+
+        def feed(unit, splittable):
+            nonlocal length
+            if length + len(unit.rstrip()) > room():
+                yield from flush()
+            if len(unit.rstrip()) <= room():
+                packet.append(unit)
+                length += len(unit)
+            elif splittable:
+                for word in WORD.finditer(unit):
+                    yield from feed(word.group(), False)
             else:
-                partsmod2 = partsmod - len(partnumber)
-                yield partnumber + source[end:end + partsmod2]
-                partnumber = f"{str(i + 2)}." if self._config["allow_part_number"] else ""
-                yield partnumber + source[end + partsmod2:end + partsmod]
+                begin = 0
+                while begin < len(unit):
+                    end = begin + room()
+                    packet.append(unit[begin:end])
+                    length += end - begin
+                    begin = end
+                    if begin < len(unit):
+                        yield from flush()
+
+        for unit in (SENTENCE if sentences else WORD).finditer(source):
+            if unit.group():
+                yield from feed(unit.group(), sentences)
+        yield from flush()
 
     def pregenerate_bytes(self, source, encoding=appconfig.DEFAULT_ENCODING):
         LOGGER.info("Inititalizing bytes pregenerator engine")
+        if codecs.lookup(encoding).name != "utf-8":
+            yield from self.pregenerate_codepoints(source, encoding)
+            return
+        # source is encoded once, packets are cut on code point boundaries
+        data = memoryview(source.encode("utf-8"))
+        size = len(data)
+        ptr = 0
+        i = 1
+        while ptr < size:
+            partnumber = f"{str(i)}." if self._config["allow_part_number"] else ""
+            end = min(ptr + self._config["max_packet_length"] - len(partnumber), size)
+            while ptr < end < size and data[end] & 0xC0 == 0x80:
+                end -= 1
+            if end <= ptr:
+                # code point is longer than packet, it is sent whole
+                end = ptr + 1
+                while end < size and data[end] & 0xC0 == 0x80:
+                    end += 1
+            i += 1
+            yield partnumber + str(data[ptr:end], "utf-8")
+            ptr = end
+
+    def pregenerate_codepoints(self, source, encoding):
+        """
+        Bytes pregenerator for encodings where code point boundaries can't be
+        found in encoded data. Every character is measured separately
+        """
         ptr = 0
         i = 1
         while ptr < len(source):
-            firstbuf = bytes()
             partnumber = f"{str(i)}." if self._config["allow_part_number"] else ""
-            firstbuf += partnumber.encode("utf-8")
-            while len(firstbuf) < self._config["max_packet_length"] and ptr < len(source):
-                byte = source[ptr].encode(encoding)
-                if len(byte) + len(firstbuf) <= self._config["max_packet_length"]:
-                    firstbuf += byte
-                    ptr += 1
-                else:
+            size = len(partnumber.encode(encoding))
+            begin = ptr
+            while ptr < len(source):
+                size += len(source[ptr].encode(encoding))
+                if size > self._config["max_packet_length"] and ptr > begin:
                     break
-            if len(firstbuf) > 0:
-                i += 1
-                yield firstbuf.decode("utf-8")
+                ptr += 1
+            i += 1
+            yield partnumber + source[begin:ptr]
 
     def pregenerate(self, source):
         LOGGER.info("Accepted new pipeline string. Length: {}".format(len(source)))
         if self._config["limit_type"] == "bytes":
             return self.pregenerate_bytes(source)
+        elif self._config["limit_type"] == "words":
+            return self.pregenerate_words(source)
+        elif self._config["limit_type"] == "sentences":
+            return self.pregenerate_words(source, sentences=True)
         else:
             return self.pregenerate_symbol(source)
 
@@ -176,6 +293,40 @@ class Pipeline:
             for item in array:
                 yield item
 
+    def stream(self, pregenerator):
+        """
+        Yields packets as they are cut from source. Only one packets_count window
+        is kept in memory, windowing is applied per window like in Dandelion engine
+        """
+        LOGGER.info("Initializing Stream engine")
+        start = self._config["start"]
+        stop = self._config["stop"]
+        desc = self._config["step"] < 0
+        step = abs(self._config["step"])
+        while True:
+            window = list(islice(pregenerator, self._config["packets_count"]))
+            if not window:
+                return
+            array = window[start:stop:][::step]
+            if desc:
+                array = array[::-1]
+            yield from array
+
+    def _exhausted(self):
+        if self._maxc is not None:
+            return self._c >= self._maxc
+        if not self._lookahead:
+            try:
+                self._lookahead.append(next(self._packets))
+            except StopIteration:
+                return True
+        return False
+
+    def _take(self):
+        if self._lookahead:
+            return self._lookahead.pop()
+        return next(self._packets)
+
     def rose(self, pregenerator):
         LOGGER.info("Initializing Rose engine")
         start = self._config["start"]
@@ -194,44 +345,76 @@ class Pipeline:
         self._maxc = len(rolls)
         return iter(rolls)
 
-    def iterate(self):
-        version = self._cfg.absolute_cfg("PIPELINE_ENGINE", None) or "DANDELION"
+    def _step(self):
+        """
+        Advances pipeline by one packet without waiting
+        :return: tuple (delays in ms to wait before result, result).
+        Result is None if pipeline is over
+        """
+        delays = []
         if self._packets is None:
-            if version == "DANDELION":
+            version = self._cfg.absolute_cfg("PIPELINE_ENGINE", None) or "DANDELION"
+            if version == "STREAM" or is_stream(self._source):
+                self._packets = self.stream(self.preprocess())
+                self._maxc = None  # unknown until source is exhausted
+            elif version == "DANDELION":
                 self._packets = self.dandelion(self.preprocess())
                 next(self._packets)
             else:
                 self._packets = self.rose(self.preprocess())
             self._c = 0
-            delay(self._config["initial_delay"])
+            delays.append(self._config["initial_delay"])
         if self._c > 0:
-            delay(self._config["packet_delay"])
-        if self._c >= self._maxc:
+            delays.append(self._config["packet_delay"])
+        if self._exhausted():
             LOGGER.debug(f"Interrupting iteration. Packets sent: {self._c}/{self._maxc}")
-            raise StopIteration
+            return delays, None
         if self._c % self._config["packets_count"] == 0 and self._c != 0 and not self._limit_marker:
             LOGGER.debug("Set limit marker")
             self._limit_marker = True
             if self._config["after_limit"] == "special_delay":
-                delay(self._config["special_delay"])
+                delays.append(self._config["special_delay"])
             elif self._config["after_limit"] == "initial_delay":
-                delay(self._config["initial_delay"])
+                delays.append(self._config["initial_delay"])
             elif self._config["after_limit"] == "finish":
-                raise StopIteration
+                return delays, None
             elif self._config["after_limit"] == "user_action":
                 LOGGER.info(f"User action callback, packets count={self._c}/{self._maxc}")
-                return "$:USER_ACTION"
+                return delays, "$:USER_ACTION"
         else:
             LOGGER.debug("Disable limit marker")
             self._limit_marker = False
         self._c += 1
-        result = next(self._packets)
+        try:
+            result = self._take()
+        except StopIteration:
+            return delays, None
         resultsize = len(result.encode(appconfig.DEFAULT_ENCODING))
         LOGGER.debug("Rolled packet with length {} and size {} bytes".format(len(result), resultsize))
+        return delays, result
+
+    def iterate(self):
+        delays, result = self._step()
+        for ms in delays:
+            self._delay(ms)
+        if result is None:
+            raise StopIteration
+        return result
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        delays, result = self._step()
+        for ms in delays:
+            await asyncio.sleep(int(ms) / 1000)
+        if result is None:
+            raise StopAsyncIteration
         return result
 
     def is_specific_source(self):
         return not(isinstance(self.source, str) \
+            or is_stream(self.source) \
             or isinstance(self.source, list) \
             or isinstance(self.source, tuple) \
             or isinstance(self.source, dict))
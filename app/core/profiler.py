@@ -0,0 +1,43 @@
+import time
+from contextlib import contextmanager
+
+
+class PhaseProfiler:
+    """
+    Records wall time of named phases, nested phases are indented in report
+    """
+
+    def __init__(self):
+        self._phases = []  # (depth, name, seconds)
+        self._depth = 0
+        self._started = time.perf_counter()
+
+    @contextmanager
+    def phase(self, name):
+        index = len(self._phases)
+        self._phases.append((self._depth, name, 0.0))
+        self._depth += 1
+        begin = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._depth -= 1
+            self._phases[index] = (self._depth, name, time.perf_counter() - begin)
+
+    @property
+    def total(self):
+        return time.perf_counter() - self._started
+
+    def phases(self):
+        """
+        :return: list of (depth, name, seconds) in order phases were started
+        """
+        return list(self._phases)
+
+    def report(self, total=None):
+        total = total or self.total
+        lines = [f"{'phase':<40}{'ms':>10}{'%':>8}"]
+        for depth, name, seconds in self._phases:
+            lines.append(f"{'  ' * depth + name:<40}{seconds * 1000:>10.2f}{seconds * 100 / total:>8.1f}")
+        lines.append(f"{'total':<40}{total * 1000:>10.2f}{100:>8.1f}")
+        return "\n".join(lines)
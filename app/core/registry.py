@@ -10,32 +10,144 @@ LOGGER = get_logger("registry")
 
 
 SPECIAL_SYMBOLS = [':', ' ', '=']
+SYMBOL_PRIORITY = {symbol: i for i, symbol in enumerate(SPECIAL_SYMBOLS)}
+END = None  # trie key of registry end, value is registry insertion number
+
+
+def is_special(name):
+    return len(name) > 3 or name.isalpha()
+
+
+class Router:
+    """
+    Compiled registries. Special registries are kept in trie, so splitting costs
+    length of longest registry name instead of count of registries.
+    Resolved modules are cached by registry
+    """
+
+    def __init__(self, registries):
+        self._registries = registries
+        self._trie = {}
+        self._order = {}  # special registry -> insertion number
+        self._counter = 0
+        self._resolved = {}  # registry -> (modules, modules key or None, module)
+        self.rebuild()
+
+    def rebuild(self):
+        self._trie.clear()
+        self._order.clear()
+        self._resolved.clear()
+        self._counter = 0
+        for name in self._registries:
+            self.added(name)
+
+    def added(self, name):
+        self._resolved.clear()
+        if not isinstance(name, str) or not is_special(name):
+            return
+        node = self._trie
+        for char in name:
+            node = node.setdefault(char, {})
+        node[END] = self._counter
+        self._order[name] = self._counter
+        self._counter += 1
+
+    def changed(self):
+        self._resolved.clear()
+
+    def split(self, request):
+        if len(request) >= 3 and request.startswith("0"):
+            return request[:3], request[4:]
+        elif request.startswith(' '):
+            return "default", request[1:]
+        elif not self._order:
+            return "default", request
+        # same priority as checking symbols in order, then registries in order
+        best = None
+        node = self._trie
+        for i, char in enumerate(request[:-1]):
+            node = node.get(char)
+            if node is None:
+                break
+            order = node.get(END)
+            symbol = SYMBOL_PRIORITY.get(request[i + 1])
+            if order is not None and symbol is not None:
+                if best is None or (symbol, order) < best[:2]:
+                    best = symbol, order, i + 1
+        if best is not None:
+            return request[:best[2]], request[best[2] + 1:]
+        elif request in self._order:
+            return request, ""
+        else:
+            return "default", request
+
+    def resolved(self, registry, modules):
+        entry = self._resolved.get(registry)
+        if entry is not None and entry[0] is modules \
+                and (entry[1] is None or modules.get(entry[1]) is entry[2]):
+            return entry[2]
+        return None
+
+    def remember(self, registry, modules, key, module):
+        self._resolved[registry] = (modules, key, module)
+
+
+class RegistryTable(dict):
+    """
+    Registries dict which keeps its compiled router in sync with content
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.router = Router(self)
+
+    def __setitem__(self, key, value):
+        new = key not in self
+        super().__setitem__(key, value)
+        if new:
+            self.router.added(key)
+        else:
+            self.router.changed()
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self.router.rebuild()
+
+    def pop(self, *args):
+        result = super().pop(*args)
+        self.router.rebuild()
+        return result
+
+    def popitem(self):
+        result = super().popitem()
+        self.router.rebuild()
+        return result
+
+    def clear(self):
+        super().clear()
+        self.router.rebuild()
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+
+def router_of(registries):
+    if isinstance(registries, RegistryTable):
+        return registries.router
+    return Router(registries)
 
 
 def split(request, registries):
     '''
     Split into registry and request for further request handling in target module
     '''
-    special = list(filter(lambda x: len(x) > 3 or x.isalpha(), registries.keys()))
-    if len(request) >= 3 and request.startswith("0"):
-        reg = request[:3]
-        req = request[4:]
-        return reg, req
-    elif request.startswith(' '):
-        return "default", request[1:]
-    elif len(special) > 0:
-        for symbol in SPECIAL_SYMBOLS:
-            for specreg in special:
-                if request.startswith(specreg + symbol):
-                    reg = request[:len(specreg + symbol) - 1]
-                    req = request[len(specreg + symbol):]
-                    return reg, req
-        if request in special:
-            return request, ""
-        else:
-            return "default", request
-    else:
-        return "default", request
+    return router_of(registries).split(request)
 
 
 def load_predefined_registries(app):
@@ -49,37 +161,83 @@ def load_predefined_registries(app):
         init_stdmodules(app)
     
 
+def read_registry():
+    """
+    :return: registries from registry.json
+    """
+    return read_json(os.path.join(DATA_PATH, "registry.json"))
+
+
 def get_registry():
     """
     Loads registries to app
     """
     LOGGER.debug("Getting registries")
-    registry = os.path.join(DATA_PATH, "registry.json")
-    registry = read_json(registry)
+    registry = read_registry()
     if "default" not in registry:
         registry["default"] = "000"
+    registry = RegistryTable(registry)
     load_std_registry(registry)
     return registry
 
 
+def reload_registry(app, previous):
+    """
+    Applies changes of registry.json to app registries in place.
+    Registries removed from file fall back to defaults (module name or "000")
+    :param previous: registries which were loaded from file before
+    :return: current registries from file
+    """
+    current = read_registry()
+    for name in previous:
+        if name in current or app.registries.get(name) != previous[name]:
+            continue
+        if name == "default":
+            app.registries[name] = "000"
+        elif name in app.modules or is_std_registry(name):
+            app.registries[name] = name
+        else:
+            del app.registries[name]
+    for name, value in current.items():
+        if app.registries.get(name) != value:
+            app.registries[name] = value
+    LOGGER.info(f"Registries reloaded: {len(current)} from registry.json")
+    return current
+
+
 def route(registry, modules, registries, app):
     '''
     Routing to module by registry
     '''
+    router = registries.router if isinstance(registries, RegistryTable) else None
+    if router:
+        module = router.resolved(registry, modules)
+        if module is not None:
+            return module
+    key, module = _resolve(registry, modules, registries, app)
+    if router and module is not None:
+        router.remember(registry, modules, key, module)
+    return module
+
+
+def _resolve(registry, modules, registries, app):
+    """
+    :return: tuple (key in modules or None for stdmodule, module)
+    """
     LOGGER.debug("Rounting registry...")
     if is_std_registry(registry):
-        return get_stdmodule(registry, app)
+        return None, get_stdmodule(registry, app)
     if registry.lower() == "default":
         registry = registries["default"]
         if registry not in registries:
             LOGGER.error("Default registry wasn't found")
-            return None
+            return None, None
     if registries[registry] in modules:
-        return modules[registries[registry]]
+        return registries[registry], modules[registries[registry]]
     elif registries[registry].replace(".py", "") in modules:
-        return modules[registries[registry].replace(".py", "")]
+        return registries[registry].replace(".py", ""), modules[registries[registry].replace(".py", "")]
     elif is_std_registry(registries[registry]):
-        return get_stdmodule(registries[registry])
+        return None, get_stdmodule(registries[registry])
     else:
         LOGGER.error(f"Registry {registry} wasn't found in modules")
-        return None
+        return None, None
@@ -0,0 +1,76 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event
+from . import delivery
+from .logger import get_logger
+
+
+LOGGER = get_logger("scheduler")
+
+
+class DeadlineTimer:
+    """
+    Pipeline timer which waits until packet deadlines instead of sleeping.
+    Next deadline is counted from previous one, so time spent by delivery
+    services is not added to delays
+    """
+
+    def __init__(self, cancelled):
+        self._cancelled = cancelled
+        self._deadline = None
+
+    def wait(self, ms):
+        interval = int(ms) / 1000
+        now = time.monotonic()
+        if self._deadline is None or now - self._deadline > interval:
+            # first packet or long pause (user action), counting from now
+            self._deadline = now
+        self._deadline += interval
+        timeout = self._deadline - time.monotonic()
+        if timeout > 0:
+            self._cancelled.wait(timeout)
+        if self._cancelled.is_set():
+            LOGGER.info("Delivery is cancelled")
+            raise StopIteration
+
+
+class DeliveryScheduler:
+    """
+    Delivers responses in background thread in order of submitting,
+    so request lock isn't held while packets are delayed and sent
+    """
+
+    def __init__(self):
+        LOGGER.debug("Creating delivery scheduler")
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="delivery")
+        self._cancelled = Event()
+
+    @staticmethod
+    def _run(function, args, kwargs):
+        try:
+            return function(*args, **kwargs)
+        except Exception:
+            LOGGER.exception("Scheduled delivery exception: ")
+
+    def submit(self, function, *args, **kwargs):
+        """
+        Schedules function call after all previously submitted deliveries
+        :return: concurrent.futures.Future
+        """
+        return self._executor.submit(self._run, function, args, kwargs)
+
+    def deliver(self, pipeline, services, user_action=None):
+        """
+        Schedules rolling of filled pipeline. Pipeline mustn't be used by caller anymore
+        """
+        def roll():
+            pipeline.bind_timer(DeadlineTimer(self._cancelled))
+            delivery.roll_pipeline(pipeline, services, user_action)
+
+        LOGGER.debug("Scheduling pipeline delivery")
+        return self.submit(roll)
+
+    def shutdown(self, wait=True):
+        LOGGER.debug("Shutting down delivery scheduler")
+        self._cancelled.set()
+        self._executor.shutdown(wait=wait)
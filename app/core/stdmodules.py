@@ -19,8 +19,7 @@ class Idel(Module):
         else:
             return None
 
-    @property
-    def configs(self):
+    def _build_configs(self):
         return self.standard_params({"ENTER_CONTEXT": True, "NOCACHE": True})
 
 
@@ -28,9 +27,19 @@ class Fdel(Module):
     def __init__(self, app):
         super().__init__("fdel", None, None, app)
         self.text = None
-        self.mnemonic_toggle = False
+        self._toggle = False
         self._chapter_ptr = 0
 
+    @property
+    def mnemonic_toggle(self):
+        return self._toggle
+
+    @mnemonic_toggle.setter
+    def mnemonic_toggle(self, value):
+        if value != self._toggle:
+            self._toggle = value
+            self.invalidate_configs()
+
     def init(self):
         path = module_path("fdel")
         if os.path.exists(path):
@@ -117,8 +126,7 @@ class Fdel(Module):
         else:
             return "File not found"
 
-    @property
-    def configs(self):
+    def _build_configs(self):
         return self.standard_params(
             {"NOCACHE": True,
              "ENTER_CONTEXT": self.mnemonic_toggle,
@@ -147,8 +155,7 @@ class Help(Module):
                 obj = self._app.delivery_services[module]
             obj.help(*values[1:])
 
-    @property
-    def configs(self):
+    def _build_configs(self):
         return self.standard_params({"NOCACHE": True})
 
 
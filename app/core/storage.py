@@ -1,8 +1,9 @@
 import os
 import json
-from .appconfig import APP_PATH, DATA_PATH, DEFAULT_ENCODING
+import importlib
+from .appconfig import APP_PATH, DATA_PATH, DEFAULT_ENCODING, PIP_WHEELHOUSE
 from .logger import get_logger
-from .import_service import pip_install
+from .import_service import pip_install, requirement_installed, unique_requirements
 
 
 LOGGER = get_logger("storage")
@@ -115,25 +116,38 @@ def get_ooc_commands():
         return {}
 
 
-def satisfact_requirements(requirements):
+def satisfact_requirements(requirements, wheelhouse=PIP_WHEELHOUSE):
+    """
+    Installs missing requirements of all plugins at once.
+    Installed distributions are checked with importlib.metadata, pip runs only
+    for missing ones, markers.json is written only if it's changed
+    :param requirements: requirements of all plugins, may contain duplicates
+    :return: list of requirements which are satisfied
+    """
     reqmarker = os.path.join(DATA_PATH, "markers.json")
-    if not os.path.exists(reqmarker):
-        with open(reqmarker, "w", encoding=DEFAULT_ENCODING) as f:
-            f.write("{}")
-        marker = {}
-    else:
-        with open(reqmarker, "r", encoding=DEFAULT_ENCODING) as f:
-            marker = json.load(f)
-    if "pip" in marker:
-        if any(map(lambda x: x not in marker["pip"], requirements)):
-            print(pip_install(requirements).stdout)
-            for requirement in requirements:
-                if requirement not in marker["pip"]:
-                    marker["pip"].append(requirement)
-    else:
-        marker["pip"] = []
-    with open(reqmarker, "w", encoding=DEFAULT_ENCODING) as f:
-        json.dump(marker, f, ensure_ascii=False)
+    marker = read_json(reqmarker) if os.path.exists(reqmarker) else {}
+    installed = marker.get("pip", [])
+    satisfied = []
+    missing = []
+    for requirement in unique_requirements(requirements):
+        state = requirement_installed(requirement)
+        if state or (state is None and requirement in installed):
+            satisfied.append(requirement)
+        else:
+            missing.append(requirement)
+    if missing:
+        result = pip_install(missing, wheelhouse)
+        print(result.stdout)
+        if result.returncode == 0:
+            satisfied.extend(missing)
+        else:
+            LOGGER.error(f"Failed to install requirements: {' '.join(missing)}")
+        importlib.invalidate_caches()
+    updated = installed + [requirement for requirement in satisfied if requirement not in installed]
+    if "pip" not in marker or updated != installed:
+        marker["pip"] = updated
+        write_json(reqmarker, marker)
+    return satisfied
 
 
 init()
@@ -1,8 +1,48 @@
+import asyncio
+from threading import Thread
+
+
 def dummy(*args, **kwargs):
     # empty function
     pass
 
 
+def run_coroutine(coro):
+    """
+    Runs coroutine to completion from synchronous code.
+    If event loop is already running in this thread, coroutine is run
+    in separate thread with its own event loop
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    result = {}
+
+    def runner():
+        try:
+            result["value"] = asyncio.run(coro)
+        except BaseException as e:
+            result["error"] = e
+
+    thread = Thread(target=runner)
+    thread.start()
+    thread.join()
+    if "error" in result:
+        raise result["error"]
+    return result.get("value")
+
+
+async def call_maybe_async(function, *args, **kwargs):
+    """
+    Calls function and awaits result if function is a coroutine function
+    """
+    result = function(*args, **kwargs)
+    if asyncio.iscoroutine(result):
+        result = await result
+    return result
+
+
 class ChapteredText:
     def __init__(self, text):
         self._chapters = {"Header": ""}
@@ -0,0 +1,161 @@
+import os
+from threading import Thread, Event
+from .appconfig import DATA_PATH
+from .mnemonics import load_global_mnemonics
+from .registry import read_registry, reload_registry, is_std_registry
+from .storage import get_ooc_commands
+from .logger import get_logger
+
+try:
+    from inotify_simple import INotify, flags
+except ImportError:
+    INotify = None
+
+
+LOGGER = get_logger("watcher")
+
+WATCHED_FILES = ("config.txt", "registry.json", "commands.json", "mnemonic.json")
+
+
+def signature(path):
+    """
+    :return: (mtime, size) of file, None if file doesn't exist
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class ConfigWatcher:
+    """
+    Watches data files and reloads only the changed one into running app:
+    config.txt into Config, registry.json into App.registries,
+    commands.json into App.ooc and mnemonic.json into App.mnems.
+    Uses inotify if inotify_simple is installed, polls mtimes otherwise
+    """
+
+    def __init__(self, app, interval=1.0, path=DATA_PATH):
+        self._app = app
+        self._interval = interval
+        self._path = path
+        self._stopped = Event()
+        self._thread = None
+        self._reloaders = {
+            "config.txt": self.reload_config,
+            "registry.json": self.reload_registries,
+            "commands.json": self.reload_commands,
+            "mnemonic.json": self.reload_mnemonics
+        }
+        self._signatures = {name: signature(self.file(name)) for name in WATCHED_FILES}
+        self._registries = self._read(read_registry)
+        self._commands = self._read(get_ooc_commands)
+
+    def file(self, name):
+        return os.path.join(self._path, name)
+
+    @staticmethod
+    def _read(loader):
+        try:
+            return loader() or {}
+        except (OSError, ValueError):
+            LOGGER.exception("Failed to read watched file: ")
+            return {}
+
+    def reload_config(self):
+        with self._app.request_lock:
+            self._app.config.load_configfile()
+
+    def reload_registries(self):
+        app = self._app
+        with app.request_lock:
+            self._registries = reload_registry(app, self._registries)
+            suggestions = tuple(name for name in app.registries if name in self._registries
+                                or name == "default" or is_std_registry(name))
+            if app.gsuggestions is app.DEFAULT_GSUGGESTIONS:
+                app._gsuggestions = suggestions
+            app.DEFAULT_GSUGGESTIONS = suggestions
+
+    def reload_commands(self):
+        app = self._app
+        commands = get_ooc_commands()
+        with app.request_lock:
+            for command in self._commands:
+                if command not in commands and app.ooc.get(command) == self._commands[command]:
+                    del app.ooc[command]
+            for command, value in commands.items():
+                app.define_ooc_command(command, value)
+        LOGGER.info(f"Out of context commands reloaded: {len(commands)} from commands.json")
+        self._commands = commands
+
+    def reload_mnemonics(self):
+        mnems = load_global_mnemonics()
+        with self._app.request_lock:
+            # contexts keep reference to this dict, so it's updated in place
+            self._app.mnems.clear()
+            self._app.mnems.update(mnems)
+        LOGGER.info(f"Mnemonics reloaded: {len(mnems)} from mnemonic.json")
+
+    def check(self, names=WATCHED_FILES):
+        """
+        Reloads files which were changed since previous check
+        :return: names of reloaded files
+        """
+        reloaded = []
+        for name in names:
+            current = signature(self.file(name))
+            if current == self._signatures[name]:
+                continue
+            self._signatures[name] = current
+            LOGGER.info(f"{name} was changed, reloading")
+            try:
+                self._reloaders[name]()
+                reloaded.append(name)
+            except (OSError, ValueError):
+                # file may be caught in the middle of writing, next change reloads it again
+                LOGGER.exception(f"Failed to reload {name}: ")
+        return reloaded
+
+    def _poll(self):
+        while not self._stopped.wait(self._interval):
+            self.check()
+
+    def _inotify(self):
+        """
+        :return: INotify watching data directory, None if inotify is unavailable
+        """
+        if INotify is None:
+            return None
+        try:
+            inotify = INotify()
+            mask = flags.CLOSE_WRITE | flags.MOVED_TO | flags.DELETE | flags.MOVED_FROM
+            inotify.add_watch(self._path, mask)
+            return inotify
+        except OSError:
+            LOGGER.exception("inotify is unavailable, falling back to polling: ")
+            return None
+
+    def _notify(self, inotify):
+        with inotify:
+            # files changed before watch was added
+            self.check()
+            while not self._stopped.is_set():
+                names = {event.name for event in inotify.read(timeout=int(self._interval * 1000))}
+                names = [name for name in WATCHED_FILES if name in names]
+                if names:
+                    self.check(names)
+
+    def start(self):
+        LOGGER.debug(f"Watching data files in {self._path}")
+        self._stopped.clear()
+        inotify = self._inotify()
+        target, args = (self._notify, (inotify,)) if inotify is not None else (self._poll, ())
+        self._thread = Thread(target=target, args=args, name="config-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
@@ -1,6 +1,16 @@
 import os
-import time
-import json
+import subprocess as sub
+from queue import Queue
+from threading import Thread, Timer, Lock
+from core.logger import get_logger
+
+
+LOGGER = get_logger("termux")
+
+
+# directory with termux-* executables, empty - search in PATH
+COMMAND_PREFIX = os.environ.get("TERMUX_COMMAND_PREFIX", "")
+REMOVE_DELAY = 1.0  # seconds notifications stay visible after delivery is finished
 
 ids = []
 count = 1
@@ -14,20 +24,128 @@ speech_params = {
 }
 
 
-def escape(string):
-    return json.dumps(string, ensure_ascii=False)
+class CommandBackend:
+    """
+    Runs termux-* commands as subprocesses with argument lists, without shell.
+    Replace it with set_backend to use other executables
+    """
+
+    def __init__(self, prefix=""):
+        self.prefix = prefix
+
+    def command(self, name, *args):
+        executable = os.path.join(self.prefix, name) if self.prefix else name
+        return [executable] + [str(arg) for arg in args]
+
+    def start(self, name, *args):
+        return sub.Popen(self.command(name, *args), stdin=sub.DEVNULL,
+                         stdout=sub.DEVNULL, stderr=sub.DEVNULL)
+
+    def run(self, name, *args):
+        return self.start(name, *args).wait()
+
+    def run_batch(self, calls):
+        """
+        Starts all commands at once and waits for them
+        :param calls: list of (name, *args) tuples
+        """
+        processes = []
+        for call in calls:
+            try:
+                processes.append(self.start(*call))
+            except OSError:
+                LOGGER.exception(f"Failed to start termux command {call[0]}: ")
+        for process in processes:
+            process.wait()
+
+
+class CommandWorker:
+    """
+    Long-lived thread which runs queued commands in order,
+    so delivery doesn't wait for process spawning
+    """
+
+    def __init__(self):
+        self._queue = Queue()
+        self._thread = None
+        self._lock = Lock()
+
+    def put(self, function, *args):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = Thread(target=self._run, name="termux-worker", daemon=True)
+                self._thread.start()
+        self._queue.put((function, args))
+
+    def _run(self):
+        while True:
+            function, args = self._queue.get()
+            if function is None:
+                return
+            try:
+                function(*args)
+            except Exception:
+                LOGGER.exception("Termux command failed: ")
+
+    def join(self):
+        """
+        Waits until all queued commands are done
+        """
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                return
+            self._queue.put((None, ()))
+            self._thread.join()
+            self._thread = None
+
+
+backend = CommandBackend(COMMAND_PREFIX)
+worker = CommandWorker()
+removals = {}  # timer -> notification ids waiting for deferred removal
+
+
+def set_backend(new_backend):
+    global backend
+    backend = new_backend
+
+
+def run(name, *args):
+    backend.run(name, *args)
+
+
+def notify(packet, id):
+    backend.run("termux-notification", "-t", "s", "--priority", "high", "-c", packet, "-i", id)
+
+
+def speak(text):
+    backend.run("termux-tts-speak", "-p", speech_params["pitch"], "-r", speech_params["rate"],
+                "-s", speech_params["stream"], text)
+
+
+def remove_notifications(batch):
+    backend.run_batch([("termux-notification-remove", id) for id in batch])
+
+
+def schedule_removal(batch):
+    def expired():
+        if removals.pop(timer, None) is not None:
+            worker.put(remove_notifications, batch)
+
+    timer = Timer(REMOVE_DELAY, expired)
+    timer.daemon = True
+    removals[timer] = batch
+    timer.start()
 
 
 def init():
     global ids
     ids = []
-    os.system("termux-wake-lock")
+    worker.put(run, "termux-wake-lock")
 
 
 def send(packet):
     global count, textbuffer, ids
-    template = "termux-notification -t s --priority high -c {} -i {}".format(escape(packet), count)
-    os.system(template)
+    worker.put(notify, packet, count)
     textbuffer += packet
     ids.append(count)
     count += 1
@@ -35,19 +153,20 @@ def send(packet):
 
 def finished(cnt):
     global ids, textbuffer
-    time.sleep(1)
-    if allow_speech:
-        pitch = speech_params["pitch"]
-        rate = speech_params["rate"]
-        stream = speech_params["stream"]
-        textbuffer = escape(textbuffer)
-        speech_template = f"termux-tts-speak -p {pitch} -r {rate} -s {stream} {textbuffer}"
-        os.system(speech_template)
-    for id in ids:
-        os.system("termux-notification-remove {}".format(id))
-    ids.clear()
+    if allow_speech and textbuffer:
+        worker.put(speak, textbuffer)
+    if ids:
+        schedule_removal(ids)
+    ids = []
     textbuffer = ""
 
 
 def exit():
-    os.system("termux-wake-unlock")
+    batch = list(ids)
+    for timer in list(removals):
+        timer.cancel()
+        batch.extend(removals.pop(timer, ()))
+    if batch:
+        worker.put(remove_notifications, batch)
+    worker.put(run, "termux-wake-unlock")
+    worker.join()
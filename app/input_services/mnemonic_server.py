@@ -1,9 +1,14 @@
+import asyncio
 import http.server
-import socketserver
+import itertools
+import queue
+import time
+from collections import OrderedDict
 from threading import Thread, Event
 import urllib.parse
 import os
 import json
+from core.logger import get_logger
 
 PORT = 6904
 HTML_BODY = "<html><head><title>Mnemonic Server</title></head><body>It is mnemonic server. Read the docs</body>"
@@ -14,9 +19,23 @@ uact = False
 httpd = None
 thread = None
 manip = None
-
-SETTINGS = {"MODE": 0x1}
-
+pool = None
+aserver = None
+active = False  # server may be started only between init and exit
+
+SETTINGS = {
+    "MODE": 0x1,
+    "SERVER": "threaded",  # or asyncio - answers with request id, result is polled by GET /result/<id>
+    "COALESCE_WINDOW": 0.3,  # seconds, identical requests within window are handled once (asyncio server)
+    "RESULTS_SIZE": 256,  # count of remembered request results (asyncio server)
+    "WORKERS": 2,  # at least 2, one of workers may wait for user action release
+    "QUEUE_SIZE": 32,
+    "BACKPRESSURE_STATUS": 503,  # or 429, response when request queue is full
+    "RETRY_AFTER": 1,
+    "MAX_BODY_SIZE": 65536  # bytes, larger request bodies are rejected with 413
+}
+
+LOGGER = get_logger("mnemonic_server")
 event = Event()
 
 class Manipulator:
@@ -297,33 +316,103 @@ class Manipulator:
         self._cursor = self._mods[self._selectedmod]()
         self.msg("Selected mod: {}".format(self._cursor.__name__))
 
+class RequestPool:
+    """
+    Bounded pool of workers which call handler for queued requests
+    """
+
+    def __init__(self, workers, size):
+        self._queue = queue.Queue(maxsize=size)
+        self._threads = []
+        for i in range(max(workers, 2)):
+            thread = Thread(target=self._work, name=f"mnemonic-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, request):
+        """
+        :return: False if request queue is full
+        """
+        try:
+            self._queue.put_nowait((request, time.monotonic()))
+            return True
+        except queue.Full:
+            return False
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            request, accepted = item
+            started = time.monotonic()
+            try:
+                handler(request)
+            except Exception:
+                LOGGER.exception("Mnemonic request handling exception: ")
+            LOGGER.info(f"Request {request!r} waited {(started - accepted) * 1000:.1f}ms, "
+                        f"handled in {(time.monotonic() - started) * 1000:.1f}ms")
+
+    def close(self):
+        for _ in self._threads:
+            try:
+                self._queue.put_nowait(None)
+            except queue.Full:
+                break
+
+
+def dispatch(request):
+    """
+    Passes request to worker pool
+    :return: False if request was rejected
+    """
+    if uact or (manip and manip._user_action):
+        # request releases user action, so it mustn't wait behind requests blocked by it
+        Thread(target=handler, args=[request], daemon=True).start()
+        return True
+    return pool.submit(request)
+
+
+class MnemonicHTTPServer(http.server.ThreadingHTTPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
 class MnemonicHTTPServerHandler(http.server.SimpleHTTPRequestHandler):
-    def _form_response(self):
-        self.protocol_version = 'HTTP/1.1'
-        self.send_response(200, 'OK')
+    protocol_version = "HTTP/1.1"  # keep-alive connections
+    disable_nagle_algorithm = True  # headers and body are written separately
+
+    def _form_response(self, status=200, headers=None):
+        body = bytes(HTML_BODY, 'UTF-8')
+        self.send_response(status)
         self.send_header('Content-type', 'text/html')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
         self.end_headers()
-        self.wfile.write(bytes(HTML_BODY, 'UTF-8'))
+        self.wfile.write(body)
+
+    def _accept(self, data):
+        started = time.monotonic()
+        if not data or dispatch(data):
+            self._form_response()
+        else:
+            LOGGER.warning(f"Request queue is full, rejecting {data!r}")
+            self._form_response(int(setting("BACKPRESSURE_STATUS")),
+                                {"Retry-After": str(setting("RETRY_AFTER"))})
+        LOGGER.debug(f"{self.command} {self.path} answered in {(time.monotonic() - started) * 1000:.1f}ms")
 
     def do_GET(self):
         data = self.requestline.split(" ")[1][1:]
-        thread = Thread(target=handler, args=[data])
-        thread.start()
-        self._form_response()
+        self._accept(data)
 
     def do_POST(self):
-        content_length = int(self.headers['Content-Length'])
-        post_data = urllib.parse.parse_qs(self.rfile.read(content_length).decode("utf-8"))
-        if "data" in post_data:
-            data = post_data["data"][0]
-        elif "request" in post_data:
-            data = post_data["request"][0]
-        else:
-            data = None
-        if data:
-            thread = Thread(target=handler, args=["request/" + data])
-            thread.start()
-        self._form_response()
+        length, error = content_length(self.headers.get('Content-Length'))
+        if error:
+            self.close_connection = True
+            self._form_response(error)
+            return
+        self._accept(parse_post(self.rfile.read(length)))
 
     def log_message(self, format, *args):
         enabled = False
@@ -331,6 +420,213 @@ class MnemonicHTTPServerHandler(http.server.SimpleHTTPRequestHandler):
             http.server.SimpleHTTPRequestHandler.log_message(self, format, *args)
 
 
+def content_length(value):
+    """
+    Validates Content-Length header
+    :return: tuple (length, None) or (0, HTTP status of error)
+    """
+    if value is None:
+        return 0, None
+    try:
+        length = int(value)
+    except ValueError:
+        return 0, 400
+    if length < 0:
+        return 0, 400
+    if length > int(setting("MAX_BODY_SIZE")):
+        return 0, 413
+    return length, None
+
+
+def parse_post(body):
+    """
+    Returns request from form data of POST body or None
+    """
+    post_data = urllib.parse.parse_qs(body.decode("utf-8"))
+    if "data" in post_data:
+        data = post_data["data"][0]
+    elif "request" in post_data:
+        data = post_data["request"][0]
+    else:
+        data = None
+    return "request/" + data if data else None
+
+
+class AsyncMnemonicServer:
+    """
+    Asyncio front end. Identical requests within coalescing window are handled once,
+    requests are handled one by one in order of arrival. Client gets request id
+    immediately and polls result by GET /result/<id>
+    """
+
+    def __init__(self, port, window, queue_size, results_size):
+        self._port = port
+        self._window = window
+        self._queue_size = queue_size
+        self._results_size = results_size
+        self._ids = itertools.count(1)
+        self._results = OrderedDict()  # id -> request state
+        self._recent = {}  # request -> (id, accept time)
+        self._writers = set()  # open client connections
+        self._loop = None
+        self._queue = None
+        self._stopped = None
+        self._thread = None
+
+    def start(self):
+        self._loop = asyncio.new_event_loop()
+        # created before thread starts, so stop() always has event to set
+        self._queue = asyncio.Queue(maxsize=self._queue_size)
+        self._stopped = asyncio.Event()
+        self._thread = Thread(target=self._loop.run_until_complete, args=[self._serve()],
+                              name="mnemonic-async-server", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        if not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._stopped.set)
+        self._thread.join()
+        self._thread = None
+        self._loop.close()
+
+    async def _serve(self):
+        server = await asyncio.start_server(self._client, "", self._port, reuse_address=True)
+        print("Async Http Server Serving at port", self._port)
+        worker = asyncio.create_task(self._work())
+        async with server:
+            await self._stopped.wait()
+        for writer in list(self._writers):
+            writer.close()
+        worker.cancel()
+        await asyncio.gather(worker, *(writer.wait_closed() for writer in self._writers),
+                             return_exceptions=True)
+
+    def _remember(self, request):
+        id = next(self._ids)
+        self._results[id] = {"id": id, "request": request, "status": "queued", "result": None}
+        while len(self._results) > self._results_size:
+            self._results.popitem(last=False)
+        return self._results[id]
+
+    async def _handle(self, state, accepted):
+        started = time.monotonic()
+        state["status"] = "running"
+        try:
+            state["result"] = await self._loop.run_in_executor(None, handler, state["request"])
+            state["status"] = "done"
+        except Exception:
+            LOGGER.exception("Mnemonic request handling exception: ")
+            state["status"] = "failed"
+        LOGGER.info(f"Request {state['request']!r} waited {(started - accepted) * 1000:.1f}ms, "
+                    f"handled in {(time.monotonic() - started) * 1000:.1f}ms")
+
+    async def _work(self):
+        while True:
+            state, accepted = await self._queue.get()
+            await self._handle(state, accepted)
+
+    def accept(self, request):
+        """
+        Queues request
+        :return: tuple (HTTP status, response dict)
+        """
+        now = time.monotonic()
+        recent = self._recent.get(request)
+        if recent and now - recent[1] <= self._window and recent[0] in self._results:
+            LOGGER.debug(f"Coalescing request {request!r} with {recent[0]}")
+            return 200, {"id": recent[0], "coalesced": True}
+        if uact or (manip and manip._user_action):
+            # request releases user action, so it mustn't wait behind requests blocked by it
+            state = self._remember(request)
+            asyncio.ensure_future(self._handle(state, now))
+        elif self._queue.full():
+            LOGGER.warning(f"Request queue is full, rejecting {request!r}")
+            return int(setting("BACKPRESSURE_STATUS")), {"error": "queue is full"}
+        else:
+            state = self._remember(request)
+            self._queue.put_nowait((state, now))
+        self._recent = {key: value for key, value in self._recent.items() if now - value[1] <= self._window}
+        self._recent[request] = (state["id"], now)
+        return 200, {"id": state["id"], "coalesced": False}
+
+    def route(self, method, target, body):
+        if method == "GET" and target.startswith("/result/"):
+            id = target[len("/result/"):]
+            if id.isdigit() and int(id) in self._results:
+                return 200, self._results[int(id)]
+            return 404, {"error": "unknown request id"}
+        if method == "GET":
+            request = target[1:]
+        elif method == "POST":
+            request = parse_post(body)
+        else:
+            return 405, {"error": "method isn't allowed"}
+        if not request:
+            return 200, {"id": None, "coalesced": False}
+        return self.accept(request)
+
+    async def _client(self, reader, writer):
+        self._writers.add(writer)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                started = time.monotonic()
+                try:
+                    method, target, version = line.decode("latin-1").split()
+                except ValueError:
+                    break
+                headers = {}
+                while True:
+                    header = await reader.readline()
+                    if header in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = header.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                length, error = content_length(headers.get("content-length"))
+                if error:
+                    # body isn't read, so connection can't be reused
+                    self._respond(writer, error, {"error": http.HTTPStatus(error).phrase}, False)
+                    await writer.drain()
+                    break
+                body = await reader.readexactly(length)
+                status, response = self.route(method, target, body)
+                keep_alive = headers.get("connection", "").lower() != "close" if version == "HTTP/1.1" \
+                    else headers.get("connection", "").lower() == "keep-alive"
+                self._respond(writer, status, response, keep_alive)
+                await writer.drain()
+                LOGGER.debug(f"{method} {target} answered in {(time.monotonic() - started) * 1000:.1f}ms")
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+    @staticmethod
+    def _respond(writer, status, response, keep_alive):
+        body = json.dumps(response).encode("utf-8")
+        headers = [f"HTTP/1.1 {status} {http.HTTPStatus(status).phrase}",
+                   "Content-Type: application/json",
+                   f"Content-Length: {len(body)}",
+                   "Connection: " + ("keep-alive" if keep_alive else "close")]
+        if status in (429, 503):
+            headers.append(f"Retry-After: {setting('RETRY_AFTER')}")
+        writer.write(("\r\n".join(headers) + "\r\n\r\n").encode("latin-1") + body)
+
+
+def setting(name):
+    """
+    Returns service setting, it can be overridden in config file
+    """
+    value = app.config.absolute_cfg("mnemonic_server." + name.lower()) if app else None
+    return SETTINGS[name] if value is None else value
+
+
 def server():
     print("Http Server Serving at port", PORT)
     httpd.serve_forever()
@@ -345,24 +641,26 @@ def handler(request):
         if int(app.config.absolute_cfg("mnemonic_server.mode")) == 0x1:
             manip.handle(request)
         else:
-            app.process(
+            result = app.process(
                 request,
                 user_action,
                 handle_ctx=True,
                 mnemonic_handle=True,
                 deny_cache=True)
             print(">> ", end="")
+            return result
     else:
         if request.startswith("request/"):
             print("Waiting for response...")
             request = request.replace("request/", "")
-            app.process(
+            result = app.process(
                 request,
                 user_action,
                 handle_ctx=True,
                 mnemonic_handle=False,
                 deny_cache=False)
             print(">> ", end="")
+            return result
 
 
 def user_action():
@@ -384,18 +682,55 @@ def user_action():
 
 
 def init():
-    global app, manip, thread, httpd
+    global app, manip, active
     manip = Manipulator(ctx)
     app = ctx.fork()
-    socketserver.TCPServer.allow_reuse_address = True
-    httpd = socketserver.TCPServer(("", PORT), MnemonicHTTPServerHandler)
+    active = True
+    # settings can be overridden in config file, which is loaded after input services,
+    # so server is started by subscription when configs are loaded
+    server_changed(app.config.subscribe("mnemonic_server.server", server_changed))
+
+
+def server_changed(kind):
+    """
+    Starts server of configured kind, restarts it when kind is changed
+    """
+    if not active or kind is None:
+        return
+    if (aserver if kind == "asyncio" else httpd) is not None:
+        return
+    LOGGER.info(f"Starting {kind} mnemonic server")
+    stop_server()
+    start_server(kind)
+
+
+def start_server(kind):
+    global thread, httpd, pool, aserver
+    if kind == "asyncio":
+        aserver = AsyncMnemonicServer(PORT, float(setting("COALESCE_WINDOW")),
+                                      int(setting("QUEUE_SIZE")), int(setting("RESULTS_SIZE")))
+        aserver.start()
+        return
+    pool = RequestPool(int(setting("WORKERS")), int(setting("QUEUE_SIZE")))
+    httpd = MnemonicHTTPServer(("", PORT), MnemonicHTTPServerHandler)
 
     thread = Thread(target=server)
     thread.start()
 
 
-def exit():
-    global thread, httpd
+def stop_server():
+    global thread, httpd, pool, aserver
     if httpd and thread:
         httpd.shutdown()
         httpd.server_close()
+    if pool:
+        pool.close()
+    if aserver:
+        aserver.stop()
+    thread = httpd = pool = aserver = None
+
+
+def exit():
+    global active
+    active = False
+    stop_server()
@@ -0,0 +1,7 @@
+import os
+import sys
+import tempfile
+
+# core changes working directory and reads data path on import
+os.environ.setdefault("WEARNOTIFY_DATA_PATH", tempfile.mkdtemp(prefix="wearnotify-tests-"))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,101 @@
+import os
+import types
+
+import pytest
+
+from core import cache
+from core.cache import BoundedRequestStore, ShardedRequestStore
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache, "time", types.SimpleNamespace(time=clock.time))
+    return clock
+
+
+def open_store(path, **limits):
+    shards = os.path.join(path, "requests")
+    os.makedirs(shards, exist_ok=True)
+    return BoundedRequestStore(ShardedRequestStore(shards), expirations=os.path.join(path, "expirations.log"),
+                               **limits)
+
+
+@pytest.mark.parametrize("eviction, hits, expected", [
+    # least recently used is evicted, lookup refreshes entry
+    ("lru", ["a", "b", "a"], ["a", "b", "d"]),
+    ("lru", ["a"], ["a", "c", "d"]),
+    ("lru", [], ["b", "c", "d"]),
+    # least frequently used is evicted, ties are broken by recency
+    ("lfu", ["a", "a", "b", "c"], ["a", "c", "d"]),
+    ("lfu", ["c", "b"], ["b", "c", "d"]),
+])
+def test_eviction_order(tmp_path, eviction, hits, expected):
+    store = open_store(str(tmp_path), max_entries=3, eviction=eviction)
+    for request in "abc":
+        store.put(request, request.upper())
+    for request in hits:
+        assert store.lookup(request) == (True, request.upper())
+    store.put("d", "D")
+    assert sorted(request for request in "abcd" if request in store) == expected
+
+
+def test_inserted_entry_is_not_evicted_by_lfu(tmp_path):
+    store = open_store(str(tmp_path), max_entries=2, eviction="lfu")
+    store.put("a", "A")
+    store.put("b", "B")
+    store.lookup("a")
+    store.lookup("b")
+    store.put("c", "C")
+    assert "c" in store
+    assert len(store) == 2
+
+
+def test_expired_entries_are_swept_on_lookup(tmp_path, clock):
+    store = open_store(str(tmp_path), ttl=10)
+    store.put("old", "1")
+    store.put("own", "2", ttl=100)
+    clock.now += 20
+    assert store.lookup("own") == (True, "2")
+    assert len(store) == 1
+    assert store.find("old") is None
+
+
+def test_ttl_expires_across_reload(tmp_path, clock):
+    store = open_store(str(tmp_path), ttl=10)
+    store.put("global", "1")
+    store.put("own", "2", ttl=100)
+    store.put("forever", "3", ttl=0)
+    clock.now += 8
+    store.close()
+    store = open_store(str(tmp_path), ttl=10)
+    clock.now += 5
+    store.reload()
+    assert store.lookup("global") == (False, None)
+    assert store.lookup("own") == (True, "2")
+    assert store.lookup("forever") == (True, "3")
+    clock.now += 100
+    store.reload()
+    assert store.lookup("own") == (False, None)
+    assert store.lookup("forever") == (True, "3")
+
+
+def test_restart_does_not_extend_untracked_entries(tmp_path, clock):
+    store = open_store(str(tmp_path))
+    store.put("untracked", "1")
+    store.close()
+    # ttl is enabled later, entry starts to expire from the first start with ttl
+    store = open_store(str(tmp_path), ttl=10)
+    clock.now += 8
+    store.close()
+    store = open_store(str(tmp_path), ttl=10)
+    clock.now += 5
+    assert store.lookup("untracked") == (False, None)
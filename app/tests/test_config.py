@@ -0,0 +1,95 @@
+import gc
+import types
+
+from core.config import Config
+
+
+class Listener:
+    def __init__(self):
+        self.values = []
+
+    def changed(self, value):
+        self.values.append(value)
+
+
+def make_config():
+    config = Config()
+    config._put("pipeline", {"packet_delay": 1, "limits": {"symbol": 10}})
+    config._put("retry_after", 5, "server")
+    return config
+
+
+def test_subscribe_returns_current_value():
+    config = make_config()
+    assert config.subscribe("pipeline.packet_delay", lambda value: None) == 1
+
+
+def test_subscriber_is_notified_on_put():
+    config = make_config()
+    values = []
+    config.subscribe("server.retry_after", values.append)
+    config.put("server.retry_after", 7)
+    assert values == [7]
+    assert config.absolute_cfg("server.retry_after") == 7
+
+
+def test_parent_and_child_changes_are_notified():
+    config = make_config()
+    parent, child = [], []
+    config.subscribe("pipeline", parent.append)
+    config.subscribe("pipeline.limits.symbol", child.append)
+    config.put("pipeline.limits.symbol", 20)
+    config.put("pipeline", {"packet_delay": 2, "limits": {"symbol": 30}})
+    assert [dict(value)["packet_delay"] for value in parent] == [1, 2]
+    assert child == [20, 30]
+
+
+def test_unrelated_put_is_not_notified():
+    config = make_config()
+    values = []
+    config.subscribe("pipeline.packet_delay", values.append)
+    config.put("server.retry_after", 7)
+    assert values == []
+
+
+def test_collected_method_subscriber_is_dropped():
+    config = make_config()
+    listener = Listener()
+    config.subscribe("server.retry_after", listener.changed)
+    del listener
+    gc.collect()
+    values = []
+    config.subscribe("server.retry_after", values.append)
+    config.put("server.retry_after", 7)
+    assert values == [7]
+    assert len(config._subscribers["server.retry_after"]) == 1
+
+
+def test_put_replaces_whole_subtree():
+    config = make_config()
+    config.put("pipeline", {"packet_delay": 3})
+    assert config.absolute_cfg("pipeline.limits.symbol") is None
+    assert dict(config.absolute_cfg("pipeline")) == {"packet_delay": 3}
+
+
+class Service:
+    name = "server"
+
+    def __init__(self, settings):
+        self.configs = settings
+
+    def on_configs_changed(self, hook):
+        pass
+
+
+def test_subscriber_registered_before_load_is_notified():
+    config = Config()
+    values = []
+    assert config.subscribe("server.mode", values.append) is None
+    assert config.absolute_cfg("server.mode") is None
+    app = types.SimpleNamespace(modules={}, extensions={},
+                                input_services={"server": Service({"MODE": "threaded"})})
+    config.load(app)
+    assert config.absolute_cfg("server.mode") == "threaded"
+    config.put("server.mode", "asyncio")
+    assert values == ["threaded", "asyncio"]
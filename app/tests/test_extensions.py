@@ -0,0 +1,80 @@
+import asyncio
+import os
+import types
+
+import pytest
+
+from core.models import ExtensionInfo
+
+SOURCE = '''SETTINGS = {"SINGLETON": %s}
+executed = globals().get("executed", 0) + 1
+calls = []
+
+
+def consumer():
+    calls.append(ctx.module.name if ctx.module else None)
+    return calls[-1]
+
+
+async def consumer_async():
+    await asyncio.sleep(0)
+    return ctx.module.name if ctx.module else None
+'''
+
+
+def make_extension(tmp_path, singleton=False):
+    path = tmp_path / "ext"
+    path.mkdir()
+    (path / "__init__.py").write_text("import asyncio\n" + SOURCE % singleton)
+    config = types.SimpleNamespace(relative_cfg=lambda name, plugin: False)
+    app = types.SimpleNamespace(config=config, extensions={}, runtime_cache=None)
+    return ExtensionInfo("ext", str(path), app)
+
+
+def module(name):
+    return types.SimpleNamespace(name=name, path=None)
+
+
+def test_module_executed_once_per_info(tmp_path):
+    info = make_extension(tmp_path)
+    first, second = info.build(module("a")), info.build(module("b"))
+    assert first.native_module is second.native_module is info.shared().native_module
+    assert first.native_module.executed == 1
+    assert first.context is not second.context
+
+
+def test_ctx_bound_to_calling_consumer(tmp_path):
+    info = make_extension(tmp_path)
+    first, second = info.build(module("a")), info.build(module("b"))
+    assert [first.consumer(), second.consumer(), info.shared().consumer()] == ["a", "b", None]
+    assert first.native_module.calls == ["a", "b", None]
+
+
+def test_ctx_bound_in_coroutine(tmp_path):
+    info = make_extension(tmp_path)
+    first, second = info.build(module("a")), info.build(module("b"))
+
+    async def both():
+        return await asyncio.gather(first.consumer_async(), second.consumer_async())
+
+    assert asyncio.run(both()) == ["a", "b"]
+
+
+def test_changed_file_executed_again(tmp_path):
+    info = make_extension(tmp_path)
+    old = info.build(module("a"))
+    init = os.path.join(old.path, "__init__.py")
+    with open(init, "a") as fobj:
+        fobj.write("\n\ndef added():\n    return 1\n")
+    os.utime(init, ns=(0, os.stat(init).st_mtime_ns + 1))
+    new = info.build(module("a"))
+    assert new.native_module is not old.native_module
+    assert new.added() == 1
+
+
+@pytest.mark.parametrize("singleton", [True, False])
+def test_singleton_is_opt_in(tmp_path, singleton):
+    info = make_extension(tmp_path, singleton)
+    first, second = info.build(module("a")), info.build(module("b"))
+    assert (first is second) is singleton
+    assert first.consumer() == (None if singleton else "a")
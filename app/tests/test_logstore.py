@@ -0,0 +1,104 @@
+import os
+
+from core.logstore import LogRequestStore, SEGMENT_SUFFIX, COMPACT_SUFFIX, COMPACTED_SUFFIX
+
+
+def open_store(path, max_segment_size=1 << 20):
+    # compaction is called explicitly, rotation mustn't start it in background
+    return LogRequestStore(str(path), max_segment_size=max_segment_size, compact_threshold=1 << 10)
+
+
+def files(path, suffix):
+    return sorted(name for name in os.listdir(path) if name.endswith(suffix))
+
+
+def contents(store, requests):
+    return {request: store.lookup(request) for request in requests}
+
+
+def test_put_remove_reload_round_trip(tmp_path):
+    store = open_store(tmp_path)
+    store.put("weather", "sunny")
+    store.put("news", "нет новостей")
+    store.put("weather", "rainy")
+    store.remove("news")
+    assert store.lookup("weather") == (True, "rainy")
+    assert store.lookup("news") == (False, None)
+    store.close()
+    store = open_store(tmp_path)
+    assert len(store) == 1
+    assert store.lookup("weather") == (True, "rainy")
+    assert "news" not in store
+
+
+def test_truncated_final_record_is_dropped(tmp_path):
+    store = open_store(tmp_path)
+    store.put("first", "one")
+    store.put("second", "two")
+    store.close()
+    segment = os.path.join(tmp_path, files(tmp_path, SEGMENT_SUFFIX)[-1])
+    size = os.path.getsize(segment)
+    with open(segment, "r+b") as fobj:
+        fobj.truncate(size - 2)
+    store = open_store(tmp_path)
+    assert store.lookup("first") == (True, "one")
+    assert store.lookup("second") == (False, None)
+    assert os.path.getsize(segment) < size - 2
+    store.put("third", "three")
+    store.close()
+    store = open_store(tmp_path)
+    assert contents(store, ["first", "third"]) == {"first": (True, "one"), "third": (True, "three")}
+
+
+def test_crash_before_compaction_commit_keeps_segments(tmp_path):
+    store = open_store(tmp_path, max_segment_size=64)
+    for i in range(20):
+        store.put(f"request {i % 4}", f"response {i}")
+    expected = contents(store, [f"request {i}" for i in range(4)])
+    store.close()
+    segments = files(tmp_path, SEGMENT_SUFFIX)
+    assert len(segments) > 2
+    # compacted file which wasn't renamed yet may be incomplete
+    with open(os.path.join(tmp_path, segments[-2][:-len(SEGMENT_SUFFIX)] + COMPACT_SUFFIX), "wb") as fobj:
+        fobj.write(b"\x00\x01partial")
+    store = open_store(tmp_path, max_segment_size=64)
+    assert files(tmp_path, COMPACT_SUFFIX) == []
+    assert files(tmp_path, SEGMENT_SUFFIX) == segments
+    assert contents(store, expected) == expected
+
+
+def test_committed_compaction_is_finished_on_reload(tmp_path):
+    store = open_store(tmp_path, max_segment_size=64)
+    for i in range(20):
+        store.put(f"request {i % 4}", f"response {i}")
+    expected = contents(store, [f"request {i}" for i in range(4)])
+    store.compact()
+    store.close()
+    segments = files(tmp_path, SEGMENT_SUFFIX)
+    compacted, active = segments[0], segments[1:]
+    # crash after rename: old segments are still there
+    os.rename(os.path.join(tmp_path, compacted),
+              os.path.join(tmp_path, compacted[:-len(SEGMENT_SUFFIX)] + COMPACTED_SUFFIX))
+    with open(os.path.join(tmp_path, "000000" + SEGMENT_SUFFIX), "wb") as fobj:
+        fobj.write(b"")
+    store = open_store(tmp_path, max_segment_size=64)
+    assert files(tmp_path, COMPACTED_SUFFIX) == []
+    assert files(tmp_path, SEGMENT_SUFFIX) == [compacted] + active
+    assert contents(store, expected) == expected
+
+
+def test_tombstone_survives_compaction(tmp_path):
+    store = open_store(tmp_path, max_segment_size=64)
+    store.put("removed", "value")
+    for i in range(10):
+        store.put(f"filler {i}", "x" * 16)
+    store.remove("removed")
+    for i in range(10):
+        store.put(f"later {i}", "y" * 16)
+    store.compact()
+    assert store.lookup("removed") == (False, None)
+    store.close()
+    store = open_store(tmp_path, max_segment_size=64)
+    assert store.lookup("removed") == (False, None)
+    assert store.lookup("filler 9") == (True, "x" * 16)
+    assert store.lookup("later 9") == (True, "y" * 16)
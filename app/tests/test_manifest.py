@@ -0,0 +1,41 @@
+from core import manifest
+from core.manifest import StartupManifest
+
+REQUIREMENTS = ["requests>=2.0  # http client", "", "# optional", "requests>=2.0", "six"]
+
+
+def test_second_satisfy_is_skipped(tmp_path, monkeypatch):
+    calls = []
+
+    def satisfact(requirements):
+        calls.append(list(requirements))
+        return list(requirements)
+
+    monkeypatch.setattr(manifest.storage, "satisfact_requirements", satisfact)
+    startup = StartupManifest(str(tmp_path / "manifest.json"))
+    startup.satisfy(REQUIREMENTS)
+    startup.satisfy(REQUIREMENTS)
+    startup.satisfy(["six", "requests>=2.0"])
+    assert calls == [["requests>=2.0", "six"]]
+
+
+def test_saved_satisfied_requirements_are_reused(tmp_path, monkeypatch):
+    calls = []
+    monkeypatch.setattr(manifest.storage, "satisfact_requirements",
+                        lambda requirements: calls.append(requirements) or list(requirements))
+    path = str(tmp_path / "manifest.json")
+    startup = StartupManifest(path)
+    startup.satisfy(REQUIREMENTS)
+    startup.save()
+    StartupManifest.open(path).satisfy(REQUIREMENTS)
+    assert len(calls) == 1
+
+
+def test_unsatisfied_requirement_is_retried(tmp_path, monkeypatch):
+    calls = []
+    monkeypatch.setattr(manifest.storage, "satisfact_requirements",
+                        lambda requirements: calls.append(requirements) or ["six"])
+    startup = StartupManifest(str(tmp_path / "manifest.json"))
+    startup.satisfy(["six", "missing-package"])
+    startup.satisfy(["six", "missing-package"])
+    assert len(calls) == 2
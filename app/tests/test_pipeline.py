@@ -0,0 +1,58 @@
+import os
+import types
+from threading import RLock
+
+import pytest
+
+from core.appconfig import DATA_PATH
+from core.config import Config
+from core.pipeline import Pipeline
+from core.watcher import ConfigWatcher
+
+CONFIG_FILE = os.path.join(DATA_PATH, "config.txt")
+
+
+@pytest.fixture
+def app():
+    app = types.SimpleNamespace(modules={}, extensions={}, input_services={}, request_lock=RLock())
+    app.config = Config()
+    app.config.load(app)
+    app.pipeline = Pipeline(app.config)
+    yield app
+    if os.path.exists(CONFIG_FILE):
+        os.remove(CONFIG_FILE)
+
+
+def write_config(text):
+    with open(CONFIG_FILE, "w") as fobj:
+        fobj.write(text)
+
+
+def test_config_file_reload_updates_pipeline(app):
+    watcher = ConfigWatcher(app)
+    write_config("pipeline.packet_delay=250\npipeline.limit_type=words\n")
+    assert watcher.check(["config.txt"]) == ["config.txt"]
+    assert app.pipeline.configuration["packet_delay"] == 250
+    assert app.pipeline.configuration["limit_type"] == "words"
+    assert app.pipeline.spawn().configuration["packet_delay"] == 250
+
+
+def test_removed_config_restores_pipeline_default(app):
+    default = app.pipeline.configuration["packet_delay"]
+    watcher = ConfigWatcher(app)
+    write_config("pipeline.packet_delay=250\n")
+    watcher.check(["config.txt"])
+    os.remove(CONFIG_FILE)
+    watcher.check(["config.txt"])
+    assert app.pipeline.configuration["packet_delay"] == default
+
+
+def test_reload_keeps_configured_values(app):
+    app.pipeline.config(packet_delay=0)
+    watcher = ConfigWatcher(app)
+    write_config("pipeline.packet_delay=250\npipeline.initial_delay=100\n")
+    watcher.check(["config.txt"])
+    assert app.pipeline.configuration["packet_delay"] == 0
+    assert app.pipeline.configuration["initial_delay"] == 100
+    app.pipeline.reset_config()
+    assert app.pipeline.configuration["packet_delay"] == 250
@@ -0,0 +1,101 @@
+import pytest
+
+from core.registry import RegistryTable, route, split
+
+REGISTRIES = {
+    "default": "000",
+    "note": "note",
+    "notes": "notes",
+    "note x": "note",
+    "abcd": "first",
+    "abcd:x": "second",
+    "123": "digits",
+}
+
+
+@pytest.mark.parametrize("request_, expected", [
+    # stdmodule codes and leading space
+    ("012 text", ("012", "text")),
+    (" note:x", ("default", "note:x")),
+    # symbols are tried in order ':', ' ', '=' before registries
+    ("note:x", ("note", "x")),
+    ("notes:x", ("notes", "x")),
+    ("note x:y", ("note x", "y")),
+    ("note x=y", ("note", "x=y")),
+    ("note=x y", ("note", "x y")),
+    # with the same symbol first inserted registry wins
+    ("abcd:x:y", ("abcd", "x:y")),
+    # whole request naming registry
+    ("notes", ("notes", "")),
+    # not special, unknown or not followed by symbol
+    ("123:x", ("default", "123:x")),
+    ("unknown:x", ("default", "unknown:x")),
+    ("notesx", ("default", "notesx")),
+])
+def test_split_priority(request_, expected):
+    assert split(request_, RegistryTable(REGISTRIES)) == expected
+    # plain dicts are compiled on each call and must agree with table
+    assert split(request_, dict(REGISTRIES)) == expected
+
+
+@pytest.mark.parametrize("registries, request_, expected", [
+    ({"default": "000"}, "note:x", ("default", "note:x")),
+    ({"abcd:x": "second", "abcd": "first"}, "abcd:x:y", ("abcd:x", "y")),
+    ({"abcd": "first", "abcd:x": "second"}, "abcd:x:y", ("abcd", "x:y")),
+])
+def test_split_registry_order(registries, request_, expected):
+    assert split(request_, RegistryTable(registries)) == expected
+
+
+@pytest.mark.parametrize("change, request_, expected", [
+    (lambda table: table.__setitem__("notes", "notes"), "notes:x", ("notes", "x")),
+    (lambda table: table.update({"notes": "notes"}), "notes:x", ("notes", "x")),
+    (lambda table: table.setdefault("notes", "notes"), "notes:x", ("notes", "x")),
+    (lambda table: table.__delitem__("note"), "note:x", ("default", "note:x")),
+    (lambda table: table.pop("note"), "note:x", ("default", "note:x")),
+    (lambda table: table.clear(), "note:x", ("default", "note:x")),
+])
+def test_split_follows_table_changes(change, request_, expected):
+    table = RegistryTable({"default": "000", "note": "note"})
+    split(request_, table)
+    change(table)
+    assert split(request_, table) == expected
+
+
+MODULES = {"note": "note module", "notes": "notes module", "other": "other module"}
+
+
+@pytest.mark.parametrize("registries, registry, expected", [
+    ({"note": "note"}, "note", "note module"),
+    ({"note": "notes.py"}, "note", "notes module"),
+    ({"default": "note", "note": "notes"}, "default", "notes module"),
+    ({"default": "note", "note": "notes"}, "DEFAULT", "notes module"),
+    ({"default": "missing"}, "default", None),
+    ({"note": "missing"}, "note", None),
+])
+def test_route(registries, registry, expected):
+    assert route(registry, MODULES, RegistryTable(registries), None) == expected
+    assert route(registry, MODULES, dict(registries), None) == expected
+
+
+@pytest.mark.parametrize("registry, change, expected", [
+    ("note", lambda table: table.__setitem__("note", "other"), "other module"),
+    ("note", lambda table: table.update(note="other"), "other module"),
+    ("default", lambda table: table.__setitem__("default", "other"), "other module"),
+    ("default", lambda table: table.__setitem__("note", "other"), "other module"),
+    ("note", lambda table: table.pop("note") and table.__setitem__("note", "other"), "other module"),
+])
+def test_route_cache_invalidated_by_table(registry, change, expected):
+    table = RegistryTable({"default": "note", "note": "note", "other": "other"})
+    assert route(registry, MODULES, table, None) == "note module"
+    change(table)
+    assert route(registry, MODULES, table, None) == expected
+
+
+def test_route_cache_follows_modules():
+    table = RegistryTable({"note": "note"})
+    modules = dict(MODULES)
+    assert route("note", modules, table, None) == "note module"
+    modules["note"] = "reloaded module"
+    assert route("note", modules, table, None) == "reloaded module"
+    assert route("note", {"note": "replaced module"}, table, None) == "replaced module"